@@ -1,6 +1,10 @@
 # Original Adafruit libray modified by Trevor Fillary 27-06/21 - Allow partial screen updates
 # Partial screen updates are essential for any fast moving screen objects by minimising.
 # the number of bytes sent to the screen.
+# Modified 17-10-26 - Pixel data sent as a single buffer (spidev writebytes2) rather than Python lists.
+#                     16-bit 565 RGB framebuffer mirror of the screen for partial updates without conversion.
+#                     Commands and their parameters sent as batched sequences, DC pin only written on a change.
+#                     write_window() to send a copy of the framebuffer without updating it (display_worker.py).
 # Original Library: https://github.com/pimoroni/st7789-python/blob/master/library/ST7789/__init__.py
 #
 # Copyright (c) 2014 Adafruit Industries
@@ -120,8 +124,12 @@ class ST7789(object):
         self._spi.mode = 0
         self._spi.lsbfirst = False
         self._spi.max_speed_hz = spi_speed_hz
+        # Newer spidev versions can write any buffer object (bytes, NumPy array) directly, splitting it
+        # into transfers internally, so there is no need to build Python lists of the pixel data.
+        self._writebytes2 = getattr(self._spi, 'writebytes2', None)
 
         self._dc = dc
+        self._dc_level = None   # Last level written to the DC pin
         self._rst = rst
         self._width = width
         self._height = height
@@ -131,6 +139,11 @@ class ST7789(object):
         self._offset_left = offset_left
         self._offset_top = offset_top
 
+        # 16-bit 565 RGB mirror of the screen, kept up to date by the display functions (see _mirror()).
+        # write_window() doesn't update it, so callers sending already encoded windows with it must
+        # copy the same pixels into the framebuffer themselves.
+        self.framebuffer = np.zeros((self.height, self.width), dtype='>u2')
+
         # Set DC as output.
         GPIO.setup(dc, GPIO.OUT)
 
@@ -155,16 +168,44 @@ class ST7789(object):
         data (False).  Chunk_size is an optional size of bytes to write in a
         single SPI transaction, with a default of 4096.
         """
-        # Set DC low for command, high for data.
-        GPIO.output(self._dc, is_data)
+        # Set DC low for command, high for data.  Only changed when needed as each GPIO write is a system call.
+        is_data = bool(is_data)
+        if is_data != self._dc_level:
+            GPIO.output(self._dc, is_data)
+            self._dc_level = is_data
         # Convert scalar argument to list so either can be passed as parameter.
         if isinstance(data, numbers.Number):
             data = [data & 0xFF]
+        # Buffer objects are written without any copies if spidev supports it.
+        if isinstance(data, (bytes, bytearray, memoryview, np.ndarray)):
+            if self._writebytes2 is not None:
+                self._writebytes2(data)
+                return
+            data = memoryview(data).cast('B')  # Slicing a memoryview doesn't copy the data
         # Write data a chunk at a time.
         for start in range(0, len(data), chunk_size):
             end = min(start + chunk_size, len(data))
             self._spi.xfer(data[start:end])
 
+    def send_sequence(self, sequence):
+        """Write a sequence of commands to the display, each given as a tuple of
+        (command byte, parameter bytes).  Consecutive bytes with the same DC level
+        are joined together so each run of commands or parameters is sent in a
+        single SPI transaction, rather than one transaction per byte.
+        """
+        runs = []   # [is_data, bytes] for each run of command or parameter bytes
+        for command, parameters in sequence:
+            for is_data, run in ((False, bytes((command,))), (True, bytes(parameters))):
+                if not run:
+                    continue
+                if runs and runs[-1][0] == is_data:
+                    runs[-1][1] += run
+                else:
+                    runs.append([is_data, bytearray(run)])
+
+        for is_data, run in runs:
+            self.send(run, is_data)
+
     def set_backlight(self, value):
         """Set the backlight on/off."""
         if self._backlight is not None:
@@ -202,84 +243,27 @@ class ST7789(object):
         self.command(ST7789_SWRESET)    # Software reset
         time.sleep(0.150)               # delay 150 ms
 
-        self.command(ST7789_MADCTL)
-        self.data(0x00)                 # Set scan mode for orientation of screen
-
-        self.command(ST7789_FRMCTR2)    # Frame rate ctrl - idle mode
-        self.data(0x0C)
-        self.data(0x0C)
-        self.data(0x00)
-        self.data(0x33)
-        self.data(0x33)
-
-        self.command(ST7789_COLMOD)
-        self.data(0x05)
-
-        self.command(ST7789_GCTRL)
-        self.data(0x14)
-
-        self.command(ST7789_VCOMS)
-        self.data(0x37)
-
-        self.command(ST7789_LCMCTRL)    # Power control
-        self.data(0x2C)
-
-        self.command(ST7789_VDVVRHEN)   # Power control
-        self.data(0x01)
-
-        self.command(ST7789_VRHS)       # Power control
-        self.data(0x12)
-
-        self.command(ST7789_VDVS)       # Power control
-        self.data(0x20)
-
-        self.command(0xD0)
-        self.data(0xA4)
-        self.data(0xA1)
-
-        self.command(ST7789_FRCTRL2)
-        self.data(0x0F)
-
-        self.command(ST7789_GMCTRP1)    # Set Gamma
-        self.data(0xD0)
-        self.data(0x04)
-        self.data(0x0D)
-        self.data(0x11)
-        self.data(0x13)
-        self.data(0x2B)
-        self.data(0x3F)
-        self.data(0x54)
-        self.data(0x4C)
-        self.data(0x18)
-        self.data(0x0D)
-        self.data(0x0B)
-        self.data(0x1F)
-        self.data(0x23)
-
-        self.command(ST7789_GMCTRN1)    # Set Gamma
-        self.data(0xD0)
-        self.data(0x04)
-        self.data(0x0C)
-        self.data(0x11)
-        self.data(0x13)
-        self.data(0x2C)
-        self.data(0x3F)
-        self.data(0x44)
-        self.data(0x51)
-        self.data(0x2F)
-        self.data(0x1F)
-        self.data(0x1F)
-        self.data(0x20)
-        self.data(0x23)
-
-        if self._invert:
-            self.command(ST7789_INVON)   # Invert display
-        else:
-            self.command(ST7789_INVOFF)  # Don't invert display
-
-        self.command(ST7789_SLPOUT)
-
-        self.command(ST7789_DISPON)     # Display on
+        # Rest of the setup is sent as one sequence, each command with its parameter bytes
+        self.send_sequence((
+            (ST7789_MADCTL, (0x00,)),       # Set scan mode for orientation of screen
+            (ST7789_FRMCTR2, (0x0C, 0x0C, 0x00, 0x33, 0x33)),   # Frame rate ctrl - idle mode
+            (ST7789_COLMOD, (0x05,)),
+            (ST7789_GCTRL, (0x14,)),
+            (ST7789_VCOMS, (0x37,)),
+            (ST7789_LCMCTRL, (0x2C,)),      # Power control
+            (ST7789_VDVVRHEN, (0x01,)),     # Power control
+            (ST7789_VRHS, (0x12,)),         # Power control
+            (ST7789_VDVS, (0x20,)),         # Power control
+            (0xD0, (0xA4, 0xA1)),
+            (ST7789_FRCTRL2, (0x0F,)),
+            (ST7789_GMCTRP1, (0xD0, 0x04, 0x0D, 0x11, 0x13, 0x2B, 0x3F,     # Set Gamma
+                              0x54, 0x4C, 0x18, 0x0D, 0x0B, 0x1F, 0x23)),
+            (ST7789_GMCTRN1, (0xD0, 0x04, 0x0C, 0x11, 0x13, 0x2C, 0x3F,     # Set Gamma
+                              0x44, 0x51, 0x2F, 0x1F, 0x1F, 0x20, 0x23)),
+            (ST7789_INVON if self._invert else ST7789_INVOFF, ()),  # Invert display (or not)
+            (ST7789_SLPOUT, ()),
+            (ST7789_DISPON, ()),             # Display on
+        ))
         time.sleep(0.100)               # 100 ms
 
     def begin(self):
@@ -307,17 +291,11 @@ class ST7789(object):
         x0 += self._offset_left
         x1 += self._offset_left
 
-        self.command(ST7789_CASET)       # Column addr set
-        self.data(x0 >> 8)
-        self.data(x0 & 0xFF)             # XSTART
-        self.data(x1 >> 8)
-        self.data(x1 & 0xFF)             # XEND
-        self.command(ST7789_RASET)       # Row addr set
-        self.data(y0 >> 8)
-        self.data(y0 & 0xFF)             # YSTART
-        self.data(y1 >> 8)
-        self.data(y1 & 0xFF)             # YEND
-        self.command(ST7789_RAMWR)       # write to RAM
+        self.send_sequence((
+            (ST7789_CASET, (x0 >> 8, x0 & 0xFF, x1 >> 8, x1 & 0xFF)),   # Column addr set - XSTART, XEND
+            (ST7789_RASET, (y0 >> 8, y0 & 0xFF, y1 >> 8, y1 & 0xFF)),   # Row addr set - YSTART, YEND
+            (ST7789_RAMWR, ()),                                         # write to RAM
+        ))
 
     def display(self, image=None, x0=0, y0=0, x1=None, y1=None):
         #Write the display buffer or provided image to the hardware.  If no
@@ -336,14 +314,58 @@ class ST7789(object):
             y1 = self.height-1
         self.set_window(x0, y0, x1, y1)
     
-        # Convert image to array of 16bit 565 RGB data bytes.
-        # Unfortunate that this copy has to occur, but the SPI byte writing
-        # function needs to take an array of bytes and PIL doesn't natively
-        # store images in 16-bit 565 RGB format.
-        pixelbytes = list(self.image_to_data(image))
+        # Convert image to 16bit 565 RGB data.
+        # Unfortunate that this conversion has to occur, PIL doesn't natively
+        # store images in 16-bit 565 RGB format, but the data is kept as a
+        # single buffer and sent without building any Python lists.
+        colours = self.image_to_colours(image)
+        self._mirror(colours, x0, y0, x1, y1)
         # Write data to hardware.
+        self.data(colours.view(np.uint8))
+
+    def display_data(self, pixelbytes, x0=0, y0=0, x1=None, y1=None):
+        """Write already encoded 16-bit 565 RGB data bytes (see image_to_bytes) to
+        the display.  The X & Y parameters specify the window to be updated and if
+        not specified then default to the whole screen.  Used to show pre-rendered
+        screens without converting the image every time.
+        """
+        if x1 is None:
+            x1 = self.width-1
+        if y1 is None:
+            y1 = self.height-1
+        self.set_window(x0, y0, x1, y1)
+        self._mirror(np.frombuffer(pixelbytes, dtype='>u2'), x0, y0, x1, y1)
         self.data(pixelbytes)
 
+    def write_window(self, pixelbytes, x0, y0, x1, y1):
+        """Write encoded 16-bit 565 RGB data bytes to a window of the display
+        without updating the framebuffer, eg for a copy of part of the framebuffer
+        taken earlier and sent from another thread.
+        """
+        self.set_window(x0, y0, x1, y1)
+        self.data(pixelbytes)
+
+    def _mirror(self, colours, x0, y0, x1, y1):
+        # Keep the framebuffer in step with a window written to the display
+        window = self.framebuffer[y0:y1+1, x0:x1+1]
+        if colours.size == window.size:
+            window[:] = colours.reshape(window.shape)
+
+    @staticmethod
+    def color565(r, g, b):
+        """Convert an RGB colour to 16-bit 565 RGB, eg for writing to the framebuffer."""
+        return ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
+
+    def image_to_colours(self, image):
+        """Convert a PIL image to a 2D NumPy array of 16-bit 565 RGB colours, stored high byte first."""
+        pb = np.array(image.convert('RGB')).astype('uint16')
+        color = ((pb[:,:,0] & 0xF8) << 8) | ((pb[:,:,1] & 0xFC) << 3) | (pb[:,:,2] >> 3)
+        return color.astype('>u2')
+
+    def image_to_bytes(self, image):
+        """Convert a PIL image to 16-bit 565 RGB data bytes, ready for display_data."""
+        return self.image_to_colours(image).tobytes()
+
     def image_to_data(self, image):
         # This function was obtained to support a more flexible 'display' function
         #"""Generator function to convert a PIL image to 16-bit 565 RGB bytes."""
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : benchmark.py
+# Description :	Headless benchmark of the grain engines using the stand-in hardware in sim_hardware.py.
+#               Loads hourglassOnly.bmp, fills it and runs update_grains() for fixed scenarios, reporting
+#               passes/sec, moves/sec, time to settle and display bytes/SPI transfers/dropped frames for each run.
+#               Usage: python3 benchmark.py [--engine pixel --engine numpy ...] [--scenario timing ...] [--repeat n]
+#                      [--workers 1 --workers 2 ...]  - runs the parallel engine with each number of workers
+#                      [--fps n]  - display frame rate cap, 0 for a display update every pass
+#                      The replay scenario writes its recording to the cache directory and is paced to REPLAY_SECONDS
+#                      The idle scenario leaves the settled hourglass idle for IDLE_SECONDS, reporting the CPU and I2C use
+#                      python3 benchmark.py --check   - checks the exact bytes sent to the display and the gyro decoding
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import argparse
+import os
+import sys
+import threading
+import time
+
+import sim_hardware
+sim_hardware.install() # Must be before the application modules are imported
+
+import numpy as np
+from PIL import Image
+from ST7789 import ST7789
+
+# Import application modules
+import my_globals as g
+import grains
+import display_worker
+import timer_replay
+import pass_profiler
+import frame_rate
+import hourglassgyro
+from hourglassgyro import gyro_init
+
+GRAPHIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hourglassOnly.bmp")
+
+ENGINES = {
+    'pixel': g.PIXEL_ENGINE,
+    'numpy': g.NUMPY_ENGINE,
+    'active': g.ACTIVE_ENGINE,
+    'flat': g.FLAT_ENGINE,
+    'parallel': g.PARALLEL_ENGINE,
+    'margolus': g.MARGOLUS_ENGINE,
+}
+
+SCENARIOS = ('timing', 'tilted', 'flip', 'replay', 'idle')
+TILTED_PASSES = 1500 # Number of passes for the tilted continuous run
+IDLE_SECONDS = 2     # Time the idle scenario stays settled before the button press
+REPLAY_SECONDS = 2   # Set time of the replay scenario, only paced timer runs are replayed
+IDLE_POLL_HZ = g.idle_poll_hz # The other scenarios run every pass so they can be stopped after a set number of passes
+
+# Per run statistics, updated by the monitored engine
+passes = 0
+moves = 0
+settle_time = None  # Time of the first pass with no grain moves
+stop_at_pass = 0    # Continuous runs are stopped (as if a button was pressed) after this many passes, 0 for never
+stop_when_settled = False
+idle_press = 0      # Continuous runs are stopped this many seconds after the grains settle, 0 for never
+idle_start = None   # CPU time and I2C reads when the grains settled, for the idle scenario
+run_start = 0
+
+
+def load_hourglass():
+    # Load and fill the hourglass graphic as per the menu screen in hourglass.py
+    g.no_grains = 0
+    g.image = Image.open(GRAPHIC)
+    grains.position_hourglass()
+    g.st7789.display(g.image, g.hg_tl_x,g.hg_tl_y,g.hg_br_x,g.hg_br_y)
+    grains.analyse_hourglass_graphic()
+    grains.fill_hourglass()
+
+
+def monitored_engine(select_engine):
+    # Wraps the selected engine's move function to collect the run statistics and stop continuous runs
+    def select():
+        start, move, finish = select_engine()
+
+        def move_and_monitor(Direction):
+            global passes, moves, settle_time, idle_start
+            update_count = move(Direction)
+            passes = passes + 1
+            moves = moves + update_count
+            if update_count == 0 and settle_time is None:
+                settle_time = time.perf_counter() - run_start
+                if idle_press:
+                    # The run now goes idle, press a button after a while
+                    idle_start = (time.process_time(), sim_hardware.bus.reads)
+                    threading.Timer(idle_press, press_button).start()
+
+            if g.mode == g.CONTINUOUS:
+                if (stop_at_pass and passes >= stop_at_pass) or (stop_when_settled and settle_time is not None):
+                    g.mode = g.MENU  # As if a button had been pressed
+            return update_count
+
+        return start, move_and_monitor, finish
+    return select
+
+
+def press_button():
+    # Stop a continuous run as the buttons do in hourglass.py
+    with g.mode_changed:
+        g.mode = g.MENU
+        g.mode_changed.notify_all()
+
+
+def run(mode, direction, stop_after=0, until_settled=False, idle_seconds=0):
+    global passes, moves, settle_time, stop_at_pass, stop_when_settled, idle_press, idle_start, run_start
+    # Run update_grains() once in the given mode and orientation, returns the run statistics
+    passes = 0
+    moves = 0
+    settle_time = None
+    stop_at_pass = stop_after
+    stop_when_settled = until_settled
+    idle_press = idle_seconds
+    idle_start = None
+    g.idle_poll_hz = IDLE_POLL_HZ if idle_seconds else 0
+
+    sim_hardware.set_orientation(direction)
+    sim_hardware.reset_counters()
+    display_worker.reset_counters()
+    g.mode = mode
+    run_start = time.perf_counter()
+    grains.update_grains()
+    elapsed = time.perf_counter() - run_start
+    idle = None
+    if idle_start is not None:
+        idle = (elapsed - settle_time, time.process_time() - idle_start[0], sim_hardware.bus.reads - idle_start[1])
+
+    return {
+        'passes': passes,
+        'moves': moves,
+        'seconds': elapsed,
+        'passes_per_sec': passes / elapsed,
+        'moves_per_sec': moves / elapsed,
+        'settle_seconds': settle_time,
+        'display_bytes': sim_hardware.spi_bytes,
+        'display_transfers': sim_hardware.spi_transfers,
+        'frames_dropped': display_worker.frames_dropped,
+        'fps': frame_rate.achieved_fps(),
+        'pass_percentiles': pass_profiler.percentiles() if g.profile_passes else None,
+        'i2c_reads': sim_hardware.bus.reads,
+        'idle': idle,
+    }
+
+
+def run_scenario(scenario, engine):
+    # Fill the hourglass and run one of the fixed scenarios with the given engine
+    g.engine = engine
+    g.timer_seconds = 0
+    load_hourglass()
+    timer_replay.loaded_file = None # Grains are simulated, apart from the replay scenario
+
+    if scenario == 'timing':
+        # Timer run from full, orientation forced right way up, runs until the grains settle
+        return run(g.TIMING, g.S)
+    if scenario == 'tilted':
+        # Continuous run tilted 45 deg for a fixed number of passes
+        return run(g.CONTINUOUS, g.SW, stop_after=TILTED_PASSES)
+    if scenario == 'flip':
+        # Let the sand run through, then turn the hourglass upside down and run until it settles again
+        run(g.TIMING, g.S)
+        return run(g.CONTINUOUS, g.N, until_settled=True)
+    if scenario == 'replay':
+        # Paced timer run replayed from a recording of the run (saved in the cache directory)
+        timer_replay.record(GRAPHIC)
+        g.timer_seconds = REPLAY_SECONDS
+        return run(g.TIMING, g.S)
+    if scenario == 'idle':
+        # Continuous run tilted 45 deg until the grains settle, then left idle for a while before a button press
+        return run(g.CONTINUOUS, g.SW, idle_seconds=IDLE_SECONDS)
+
+    raise ValueError("Unknown scenario: {}".format(scenario))
+
+
+def check_display():
+    # Check the exact bytes the display driver sends over SPI for a partial window update, both with the
+    # buffer write (writebytes2) and the chunked list transfer used for older spidev versions.
+    # Returns True if all checks pass
+    rgb = np.random.default_rng(1).integers(0, 256, (37, 53, 3), dtype=np.uint8)
+    image = Image.fromarray(rgb, 'RGB')
+
+    # Reference RGB565 encoding, high byte first, done a pixel at a time
+    expected = bytearray()
+    for r, gr, b in rgb.reshape(-1, 3).tolist():
+        colour = ((r & 0xF8) << 8) | ((gr & 0xFC) << 3) | (b >> 3)
+        expected += bytes((colour >> 8, colour & 0xFF))
+
+    ok = True
+    writebytes2 = g.st7789._writebytes2
+    for name, write in (('buffer', writebytes2), ('chunked', None)):
+        g.st7789._writebytes2 = write
+        sim_hardware.capture_spi()
+        g.st7789.display(image, 10, 20, 62, 56)
+        writes = sim_hardware.display_writes()
+        sim_hardware.capture_spi(False)
+        passed = len(writes) == 1 and writes[0] == (10, 20, 62, 56, bytes(expected))
+        print("display check ({}): {}".format(name, "pass" if passed else "FAIL"))
+        ok = ok and passed
+    g.st7789._writebytes2 = writebytes2
+    return ok
+
+
+def check_gyro():
+    # Check the accelerometer/gyro register decoding, including the sign handling, for the block read against
+    # the single register reads.  Returns True if all checks pass
+    values = (0, 1, -1, 32767, -32768, 256, -256, 12345)
+    ok = True
+    for start in range(0, len(values)):
+        words = [values[(start + i) % len(values)] for i in range(0, 7)]
+        for i, word in enumerate(words):
+            sim_hardware.bus.set_word(hourglassgyro.ACCEL_XOUT_H + 2 * i, word)
+        block = hourglassgyro.read_block(hourglassgyro.ACCEL_XOUT_H, hourglassgyro.ALL_BLOCK_LENGTH)
+        single = [hourglassgyro.read_raw_data(hourglassgyro.ACCEL_XOUT_H + 2 * i) for i in range(0, 7)]
+        ok = ok and list(block) == words and single == words
+
+    reads = sim_hardware.bus.reads
+    for direction in sim_hardware.ACCEL_FOR_DIRECTION:
+        sim_hardware.set_orientation(direction)
+        ok = ok and hourglassgyro.read_gyro_xy() == direction
+    ok = ok and sim_hardware.bus.reads - reads == len(sim_hardware.ACCEL_FOR_DIRECTION) # One I2C transfer each
+
+    print("gyro check: {}".format("pass" if ok else "FAIL"))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless hourglass grain engine benchmark")
+    parser.add_argument('--engine', action='append', choices=sorted(ENGINES), help="Engine(s) to run, default all")
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help="Scenario(s) to run, default all")
+    parser.add_argument('--repeat', type=int, default=1, help="Number of runs of each scenario, the fastest is reported")
+    parser.add_argument('--check', action='store_true', help="Check the bytes sent to the display and the gyro decoding, then exit")
+    parser.add_argument('--record', metavar='DIR', help="Record the grain moves of every pass of each run to DIR (pass_recorder.py)")
+    parser.add_argument('--profile', metavar='FILE', nargs='?', const='', help="Profile each pass and report the p50/p95/max pass time, optionally exporting the last run to FILE (.csv or .json)")
+    parser.add_argument('--sync-display', action='store_true', help="Send the display updates from the grains loop, not the display worker")
+    parser.add_argument('--fps', type=float, help="Display frame rate cap, 0 to update the display after every pass, default g.display_fps")
+    parser.add_argument('--workers', type=int, action='append', help="Worker processes for the parallel engine, repeat to compare the speedup, default g.parallel_workers")
+    args = parser.parse_args()
+    g.async_display = not args.sync_display
+    if args.fps is not None:
+        g.display_fps = args.fps
+    g.record_dir = args.record
+    if args.profile is not None:
+        g.profile_passes = 100000
+        g.profile_export = args.profile or None
+    g.gyro_sample_hz = 0 # Read the gyro every pass so each run starts in the set orientation
+
+    # Setup stand-in hardware, same as hourglass.py
+    gyro_init()
+    g.st7789 = ST7789(width=g.SCREEN_SIZE, height=g.SCREEN_SIZE, rotation=90, port=0, cs=1, dc=9, backlight=13, spi_speed_hz=80 * 1000 * 1000)
+    grains.select_engine = monitored_engine(grains.select_engine)
+
+    if args.check:
+        return 0 if check_display() and check_gyro() else 1
+
+    print("{:<8} {:<11} {:>7} {:>8} {:>9} {:>10} {:>9} {:>12} {:>10} {:>8} {:>6}".format(
+        "scenario", "engine", "passes", "moves", "passes/s", "moves/s", "settle s", "display B", "transfers", "dropped", "fps"))
+    for scenario in args.scenario or SCENARIOS:
+        for name in args.engine or sorted(ENGINES, key=ENGINES.get):
+            worker_counts = [None]
+            if ENGINES[name] == g.PARALLEL_ENGINE:
+                worker_counts = args.workers or [g.parallel_workers]
+            first_result = None
+            for workers in worker_counts:
+                if workers is not None:
+                    g.parallel_workers = workers
+                results = [run_scenario(scenario, ENGINES[name]) for _ in range(args.repeat)]
+                best = min(results, key=lambda result: result['seconds'])
+                settle = "-" if best['settle_seconds'] is None else "{:.3f}".format(best['settle_seconds'])
+                label = name if workers is None else "{}/{}".format(name, workers)
+                print("{:<8} {:<11} {:>7} {:>8} {:>9.0f} {:>10.0f} {:>9} {:>12} {:>10} {:>8} {:>6.1f}".format(
+                    scenario, label, best['passes'], best['moves'], best['passes_per_sec'], best['moves_per_sec'],
+                    settle, best['display_bytes'], best['display_transfers'], best['frames_dropped'], best['fps']))
+                if best['idle'] is not None:
+                    print("    idle {:.2f}s: cpu {:.3f}s, i2c reads {}".format(*best['idle']))
+                if best['pass_percentiles'] is not None:
+                    print("    pass ms p50/p95/max: {:.3f}/{:.3f}/{:.3f}".format(*[t * 1000 for t in best['pass_percentiles']]))
+                if len(worker_counts) > 1:
+                    # Speedup over the first number of workers given
+                    first_result = first_result or best
+                    print("    speedup vs {} worker(s): {:.2f}x".format(worker_counts[0], first_result['seconds'] / best['seconds']))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : dirty_tiles.py
+# Description :	Tracks which tiles of the hourglass graphic have had grain moves since the
+#               last display update so only those parts of the screen are re-sent.  The engines write
+#               grain moves straight into the palette indexed framebuffer of the hourglass (see palette.py)
+#               so an update is just a palette lookup of it
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import numpy as np
+
+# Import application modules
+import my_globals as g
+import display_worker
+import palette
+
+TILE_SHIFT = 4  # 16x16 pixel tiles
+TILE_SIZE = 1 << TILE_SHIFT
+WINDOW_COST = 512 # Approx cost of setting up an extra display window, in pixels sent.  Used to decide when to merge regions
+
+dirty = bytearray()  # One byte per tile, set to 1 when a grain moves in the tile
+tiles_across = 0
+tiles_down = 0
+width = 0            # Size of the hourglass graphic
+height = 0
+cell_tile = None     # Tile index of each pixel (y * width + x) of the hourglass graphic, for engines using linear cells
+screen = None        # Framebuffer of the hourglass box (y, x), as palette indexes
+grain_colour = None  # Palette index of each grain, in sorted grain order
+
+
+def reset(graphic_width, graphic_height, grains_x, grains_y, no_grains):
+    global dirty, tiles_across, tiles_down, width, height, cell_tile, screen, grain_colour
+    # Set up the tiles and framebuffer for the hourglass graphic and grains (sorted grains arrays).  The graphic must
+    # already be on the display, any tiles where the colours differ (eg the grains were drawn green) are flagged
+    # for the next update
+
+    width = graphic_width
+    height = graphic_height
+    tiles_across = (width + TILE_SIZE - 1) >> TILE_SHIFT
+    tiles_down = (height + TILE_SIZE - 1) >> TILE_SHIFT
+    dirty = bytearray(tiles_across * tiles_down)
+    cell_tile = [(y >> TILE_SHIFT) * tiles_across + (x >> TILE_SHIFT) for y in range(0, height) for x in range(0, width)]
+
+    grain_colour = palette.grain_colours(no_grains)
+    screen = palette.image_indexes(np.array(g.image.convert('RGB')))
+    screen[np.frombuffer(grains_y, dtype=np.uint16)[:no_grains], np.frombuffer(grains_x, dtype=np.uint16)[:no_grains]] = grain_colour
+
+    shown = g.st7789.framebuffer[g.hg_tl_y:g.hg_tl_y + height, g.hg_tl_x:g.hg_tl_x + width]
+    changed = np.zeros((tiles_down << TILE_SHIFT, tiles_across << TILE_SHIFT), dtype=bool)
+    changed[:height, :width] = palette.colours[screen] != shown
+    dirty[:] = changed.reshape(tiles_down, TILE_SIZE, tiles_across, TILE_SIZE).any(axis=(1, 3)).astype(np.uint8).tobytes()
+
+
+def move_grain(grain, x, y, new_x, new_y):
+    # Move a grain in the display framebuffer and flag the tiles it left and entered for the next update
+    screen[y, x] = g.BACKGROUND_INDEX
+    screen[new_y, new_x] = grain_colour[grain]
+    dirty[(y >> TILE_SHIFT) * tiles_across + (x >> TILE_SHIFT)] = 1
+    dirty[(new_y >> TILE_SHIFT) * tiles_across + (new_x >> TILE_SHIFT)] = 1
+
+
+def dirty_regions():
+    # Returns the regions of the hourglass graphic to update as a list of (x0, y0, x1, y1), inclusive.
+    # Each row of tiles gives the span from its first to last dirty tile, then neighbouring rows are merged
+    # into one region when the extra pixels cost less than setting up another display window.
+    regions = []
+    for row in range(0, tiles_down):
+        row_tiles = dirty[row * tiles_across:(row + 1) * tiles_across]
+        first = row_tiles.find(1)
+        if first < 0:
+            continue
+        last = row_tiles.rfind(1)
+
+        x0 = first << TILE_SHIFT
+        x1 = min((last + 1) << TILE_SHIFT, width) - 1
+        y0 = row << TILE_SHIFT
+        y1 = min((row + 1) << TILE_SHIFT, height) - 1
+
+        if regions:
+            prev_x0, prev_y0, prev_x1, prev_y1 = regions[-1]
+            if prev_y1 + 1 == y0:
+                merged_x0 = min(x0, prev_x0)
+                merged_x1 = max(x1, prev_x1)
+                merged = (merged_x1 - merged_x0 + 1) * (y1 - prev_y0 + 1)
+                separate = (prev_x1 - prev_x0 + 1) * (prev_y1 - prev_y0 + 1) + (x1 - x0 + 1) * (y1 - y0 + 1)
+                if merged <= separate + WINDOW_COST:
+                    regions[-1] = (merged_x0, prev_y0, merged_x1, y1)
+                    continue
+
+        regions.append((x0, y0, x1, y1))
+
+    return regions
+
+
+def region_bytes(x0, y0, x1, y1):
+    # Returns the display data of a region of the hourglass framebuffer (palette lookup of the indexes), and keeps
+    # the display driver's framebuffer in step with it
+    colours = palette.colours[screen[y0:y1+1, x0:x1+1]]
+    g.st7789.framebuffer[g.hg_tl_y + y0:g.hg_tl_y + y1 + 1, g.hg_tl_x + x0:g.hg_tl_x + x1 + 1] = colours
+    return colours.tobytes()
+
+
+def flush():
+    # Send the dirty regions of the framebuffer to the display and clear the tiles
+    if not g.async_display:
+        for x0, y0, x1, y1 in dirty_regions():
+            g.st7789.write_window(region_bytes(x0, y0, x1, y1), g.hg_tl_x + x0, g.hg_tl_y + y0, g.hg_tl_x + x1, g.hg_tl_y + y1)
+        dirty[:] = bytes(len(dirty))
+        return
+
+    # Copy the dirty regions and hand them to the display worker.  If the display has fallen behind and the last
+    # frame is still waiting it is dropped, its tiles are added to this frame so the screen still catches up
+    stale = display_worker.take_pending()
+    if stale is not None:
+        dirty[:] = bytes(a | b for a, b in zip(dirty, stale[0]))
+
+    regions = []
+    for x0, y0, x1, y1 in dirty_regions():
+        regions.append((g.hg_tl_x + x0, g.hg_tl_y + y0, g.hg_tl_x + x1, g.hg_tl_y + y1, region_bytes(x0, y0, x1, y1)))
+    if regions:
+        display_worker.publish(bytes(dirty), regions)
+
+    dirty[:] = bytes(len(dirty))
+
+
+def redraw():
+    # Send the whole hourglass framebuffer to the display now, eg after the graphic has been drawn with green grains
+    display_worker.wait()
+    dirty[:] = bytes(len(dirty))
+    g.st7789.write_window(region_bytes(0, 0, width - 1, height - 1), g.hg_tl_x, g.hg_tl_y, g.hg_tl_x + width - 1, g.hg_tl_y + height - 1)
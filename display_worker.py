@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : display_worker.py
+# Description :	Background thread that sends the grain display updates so the grains can keep moving
+#               while the SPI transfer is in progress.  Double buffered - the worker sends one frame while
+#               the next is built, and a frame still waiting when a newer one is published is dropped
+#               (its tiles are merged into the newer frame so nothing is lost from the screen).
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import threading
+import traceback
+
+# Import application modules
+import my_globals as g
+
+# A frame is (tiles, regions) - the dirty tiles it covers and a list of (x0, y0, x1, y1, pixel bytes) screen windows
+changed = threading.Condition()  # Guards the variables below, notified when a frame is published or sent
+pending = None    # Frame waiting to be sent
+busy = False      # Set while the worker is sending a frame
+worker = None     # Worker thread, started on the first publish
+
+frames_sent = 0
+frames_dropped = 0
+send_errors = 0   # Frames that failed to send, the worker reports the error and carries on with the next frame
+
+
+def run_worker():
+    global pending, busy, frames_sent, send_errors
+    # Worker thread - waits for a frame and sends each of its windows to the display.  A failed send is reported
+    # and the frame is counted as sent, so the thread keeps running and wait() can't block on it for ever
+    while True:
+        with changed:
+            while pending is None:
+                changed.wait()
+            tiles, regions = pending
+            pending = None
+            busy = True
+
+        try:
+            for x0, y0, x1, y1, pixelbytes in regions:
+                g.st7789.write_window(pixelbytes, x0, y0, x1, y1)
+        except Exception:
+            traceback.print_exc()
+            send_errors = send_errors + 1
+        finally:
+            with changed:
+                busy = False
+                frames_sent = frames_sent + 1
+                changed.notify_all()
+
+
+def take_pending():
+    global pending, frames_dropped
+    # Remove the frame waiting to be sent, if any, so its tiles can be merged into the next frame.
+    # Returns the stale frame or None if the worker has already taken it
+    with changed:
+        frame = pending
+        if frame is not None:
+            pending = None
+            frames_dropped = frames_dropped + 1
+        return frame
+
+
+def publish(tiles, regions):
+    global pending, worker
+    # Hand a frame to the worker, replacing any frame still waiting (see take_pending)
+    with changed:
+        if worker is None:
+            worker = threading.Thread(target=run_worker, name="display_worker", daemon=True)
+            worker.start()
+        pending = (tiles, regions)
+        changed.notify_all()
+
+
+def wait():
+    # Wait until all published frames have been sent, must be called before anything else uses the display
+    with changed:
+        while pending is not None or busy:
+            changed.wait()
+
+
+def reset_counters():
+    global frames_sent, frames_dropped, send_errors
+    # Clear the frame statistics, eg at the start of a run
+    with changed:
+        frames_sent = 0
+        frames_dropped = 0
+        send_errors = 0
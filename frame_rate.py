@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : frame_rate.py
+# Description :	Display frame rate control for update_grains().  The display is updated at a set frame
+#               interval on the monotonic clock rather than every 'n' passes, so the frame rate doesn't
+#               depend on the grain count or pass time.  Passes in between frames are skipped (their moves
+#               go out with the next frame), and if the passes are slower than the frame interval every
+#               pass gets a frame without trying to catch up the missed ones.
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import time
+
+# Import application modules
+import my_globals as g
+
+interval = 0        # Seconds between frames, 0 for a frame every pass
+next_frame = 0      # Monotonic time the next frame is due
+start_time = 0
+end_time = None     # End of the last run, None while a run is in progress
+frames = 0          # Frames sent in this (or the last) run
+
+
+def start():
+    global interval, next_frame, start_time, end_time, frames
+    # Start timing the frames of a run at up to g.display_fps frames per second
+    interval = 1.0 / g.display_fps if g.display_fps else 0
+    start_time = time.monotonic()
+    next_frame = start_time + interval
+    end_time = None
+    frames = 0
+
+
+def due():
+    global next_frame, frames
+    # Returns True if a frame is due, ie the display should be updated after this pass
+    now = time.monotonic()
+    if now < next_frame:
+        return False # Ahead of the frame rate, skip this frame
+    next_frame = next_frame + interval
+    if next_frame <= now:
+        next_frame = now + interval # Behind, one frame covers all of the passes since the last
+    frames = frames + 1
+    return True
+
+
+def finish():
+    global end_time
+    # End of the run
+    end_time = time.monotonic()
+
+
+def achieved_fps():
+    # Returns the frames per second sent in the run so far (or the last run)
+    elapsed = (end_time if end_time is not None else time.monotonic()) - start_time
+    return frames / elapsed if elapsed > 0 else 0.0
@@ -4,21 +4,38 @@
 # Description :	Utilities to analyse an hourgraph graphic, fill with grains
 #               and move grains according to the gravity direction
 # Author      : Trevor Fillary
-# modification: 16-10-2021
+# modification: 17-10-2026
 ########################################################################
+import os
 import time
+from array import array
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from ST7789 import ST7789
 
 # Import application modules
 import my_globals as g
 from hourglassgyro import read_gyro_xy
+import grains_numpy
+import grains_active
+import grains_flat
+import grains_parallel
+import grains_margolus
+import dirty_tiles
+import display_worker
+import gyro_sampler
+import pacing
+import timer_replay
+import pass_recorder
+import pass_profiler
+import quiescence
+import frame_rate
 
 
 # Definitions for the screen
 pixels = None  # Pixel graphic object
-MAX_SCREEN_INDEX = 239 # 0 to 239
-MIN_SCREEN_INDEX = 0
+HOURGLASS_WIDTH = 0  # Size of the hourglass graphic
+HOURGLASS_HEIGHT = 0
 
 # Definitions for hourglass
 HOURGLASS_TOP_Y = 0 # Inside hourglass
@@ -30,23 +47,50 @@ HOURGLASS_UPRIGHT = True # Assume upright initially
 NO_GRAIN_ROWS = 32  # Sets number of sand rows to display
 
 # Note 'simplified' fixed arrays are used to speed up processing, ie Python List processing is slow....
-grains_x = [0] * 2000           # NOTE: Nominally set to 2000, depends on how much sand is filled.  Used fixed size to speed up code
-grains_y = [0] * 2000
-sorted_grains_x = [0] * 2000
-sorted_grains_y = [0] * 2000
+# Compact unsigned 16 bit arrays, sized to the grain capacity when the hourglass graphic is analysed.
+grains_x = array('H')
+grains_y = array('H')
+sorted_grains_x = array('H')
+sorted_grains_y = array('H')
 
 grain_image = Image.new("RGB", (1, 1), (0, 255, 0)) # green, single image
 delete_grain_image = Image.new("RGB", (1, 1), (255, 255, 255)) # white, background colour, single image
 
 
+def position_hourglass():
+    # Calculate position of hourglass graphic (centre of the screen)
+    hg_width, hg_height = g.image.size
+    mid_screen = int(g.SCREEN_SIZE/2)
+    mid_hourglass_x = int(hg_width/2)
+    mid_hourglass_y = int(hg_height/2)
+    g.hg_tl_x = mid_screen - mid_hourglass_x
+    g.hg_tl_y = mid_screen - mid_hourglass_y
+    g.hg_br_x = g.hg_tl_x + hg_width - 1
+    g.hg_br_y = g.hg_tl_y + hg_height - 1
+
+
 def analyse_hourglass_graphic():
     global pixels, HOURGLASS_TOP_Y, HOURGLASS_BOTTOM_Y, HOURGLASS_CENTRE_X, HOURGLASS_CENTRE_Y
+    global HOURGLASS_WIDTH, HOURGLASS_HEIGHT, grains_x, grains_y, sorted_grains_x, sorted_grains_y
     # Routine to analyse the hourglass graphic that may change in size or position if it is updated
     # Assumes the hourglass is broadly central within the screen, background is white and hourglass
     # outline is black
 
     pixels = g.image.load()  # Load image into memory for pixel access later - check for collisions etc.
     hg_width, hg_height = g.image.size
+    HOURGLASS_WIDTH = hg_width
+    HOURGLASS_HEIGHT = hg_height
+
+    # Size the grains arrays, either as configured or enough for every background pixel of the graphic to hold a grain
+    capacity = g.max_grains
+    if capacity == 0:
+        for count, colour in g.image.convert('RGB').getcolors(hg_width * hg_height):
+            if colour == (255,255,255):
+                capacity = count
+    grains_x = array('H', bytes(2 * capacity))
+    grains_y = array('H', bytes(2 * capacity))
+    sorted_grains_x = array('H', bytes(2 * capacity))
+    sorted_grains_y = array('H', bytes(2 * capacity))
 
     # Find top y inside hourglass
     found = False
@@ -135,272 +179,367 @@ def analyse_hourglass_graphic():
 
 def fill_hourglass():
     global pixels
-    # Routine to fill the top half of the hourglass (up to the max number of rows)
-
-    for i in range(HOURGLASS_CENTRE_Y,(HOURGLASS_CENTRE_Y - NO_GRAIN_ROWS),-1):
-        fill_row(i)
-
-
-def fill_row(row_y):
-    global pixels, grains_x, grains_y
-    # For selected line, add grains to fill whole line
-    # Start by finding left most inside hourglass
-    for i in range(HOURGLASS_CENTRE_X, 0, -1):
-        if pixels[i,row_y] == (0,0,0): # black
-            # Found start of inside
-            left_x = i + 1
-            found=True
-            break
-
-    if not found:
+    # Routine to fill the top half of the hourglass (up to the max number of rows, or the number of grains
+    # set by g.fill_grains).  The rows are filled from the centre of the hourglass upwards, with the inside of each
+    # row found by scanning out from the centre x for the black outline.
+    # All of the row spans are found in one go, the grains written to the graphic in bulk and the hourglass
+    # image sent to the display once at the end.
+
+    rgb = np.array(g.image.convert('RGB'))
+    black = np.all(rgb == (0,0,0), axis=2)
+
+    if g.fill_grains == 0:
+        rows = np.arange(HOURGLASS_CENTRE_Y, HOURGLASS_CENTRE_Y - NO_GRAIN_ROWS, -1)
+    else:
+        rows = np.arange(HOURGLASS_CENTRE_Y, HOURGLASS_TOP_Y - 1, -1) # Up to the top if needed
+
+    # Find left most inside hourglass, ie scan left from centre x for black
+    left_scan = black[rows, HOURGLASS_CENTRE_X:0:-1]
+    # Next find right most inside hourglass, ie scan right from centre x for black
+    right_scan = black[rows, HOURGLASS_CENTRE_X:HOURGLASS_WIDTH]
+    if not (left_scan.any(axis=1).all() and right_scan.any(axis=1).all()):
         print ("Hourgrlass graphic error")
         exit()
-
-    # Next find right most inside hourglass
-    for i in range(HOURGLASS_CENTRE_X, MAX_SCREEN_INDEX):
-        if pixels[i,row_y] == (0,0,0): # black
-            # Found start of inside
-            right_x = i - 1
-            found=True
-            break
-
-    if not found:
-        print ("Hourgrlass graphic error")
-        exit()    
-
-    row_start = g.no_grains # capture the row index of the grains array for reordering
-    # Draw each grain image and add grain x,y to grains list for future processing of movement
-    for i in range(left_x, right_x + 1):
-        pixels[i,row_y] = (0,255,0) # write a green pixels to the local graphic for future collision checks.
-        grains_x[g.no_grains] = i
-        grains_y[g.no_grains] = row_y
-        g.no_grains = g.no_grains + 1
-
-    g.st7789.display(g.image, g.hg_tl_x,g.hg_tl_y,g.hg_br_x,g.hg_br_y)  # update hourglass image (inc added grains row) only
-    row_end = g.no_grains - 1
-    reorder_grains(row_start, row_end)
-    
-def reorder_grains(row_start, row_end):
-    global grains_x, grains_y, sorted_grains_x, sorted_grains_y
+    left_x = HOURGLASS_CENTRE_X - np.argmax(left_scan, axis=1) + 1
+    right_x = HOURGLASS_CENTRE_X + np.argmax(right_scan, axis=1) - 1
+    row_lengths = right_x - left_x + 1
+
+    # Work out how many grains to add, whole rows only unless filling to a set number of grains
+    row_ends = np.cumsum(row_lengths)
+    if g.fill_grains == 0:
+        no_grains = int(row_ends[-1])
+    else:
+        no_grains = min(g.fill_grains, int(row_ends[-1]))
+    if no_grains > len(grains_x):
+        # Fill whole rows up to the capacity rather than overflow the grains arrays
+        print ("Grain capacity reached")
+        whole_rows = row_ends[row_ends <= len(grains_x)]
+        no_grains = int(whole_rows[-1]) if whole_rows.size else 0
+
+    # Grain x,y for every cell of the rows in fill order, ie row by row left to right
+    row_starts = row_ends - row_lengths
+    row_of_grain = np.repeat(np.arange(rows.size), row_lengths)
+    x = left_x[row_of_grain] + (np.arange(row_ends[-1]) - row_starts[row_of_grain])
+    y = rows[row_of_grain]
+
+    # Position of each grain in the sorted grains arrays, then keep the first no_grains so a part filled last row
+    # still fills from the centre out
+    sorted_index = reorder_grains(row_starts, row_lengths)
+    keep = sorted_index < no_grains
+    x = x[keep]
+    y = y[keep]
+    sorted_index = sorted_index[keep]
+
+    # Add grain x,y to grains arrays for future processing of movement
+    np.frombuffer(grains_x, dtype=np.uint16)[:no_grains] = x
+    np.frombuffer(grains_y, dtype=np.uint16)[:no_grains] = y
+    np.frombuffer(sorted_grains_x, dtype=np.uint16)[sorted_index] = x
+    np.frombuffer(sorted_grains_y, dtype=np.uint16)[sorted_index] = y
+    g.no_grains = no_grains
+
+    # Write green pixels to the local graphic for future collision checks, then draw the grains
+    rgb[y, x] = (0,255,0)
+    g.image.paste(Image.fromarray(rgb, 'RGB'))
+    display_hourglass()  # update hourglass image (inc added grains) only
+
+
+def display_hourglass():
+    # Draw the hourglass graphic and grains on the display, the grains in their sand colours (see palette.py)
+    dirty_tiles.reset(*g.image.size, sorted_grains_x, sorted_grains_y, g.no_grains)
+    dirty_tiles.redraw()
+
+
+def reorder_grains(row_starts, row_lengths):
     # This section re-orders the grains list so the grains are scanned
     # either side of the centre of the hourglass towards the edges for a 
-    # more even pattern draining from the centre of the hourglass
-    mid_row = row_start + int((row_end - row_start)/2)
-    left = mid_row -1
-    right = mid_row
-    idx = row_start
-    for _ in range(row_start, row_end + 1):
-        if right <= row_end:
-            #sorted_grains.append(grains[right])
-            sorted_grains_x[idx] = grains_x[right]
-            sorted_grains_y[idx] = grains_y[right]
-            right = right + 1
-            idx = idx + 1
-        if left >= row_start:
-            #sorted_grains.append(grains[left])
-            sorted_grains_x[idx] = grains_x[left]
-            sorted_grains_y[idx] = grains_y[left]
-            left = left -1
-            idx = idx + 1
-
-    # print(grains)
-    # print(sorted_grains)
+    # more even pattern draining from the centre of the hourglass.
+    # Each row is ordered middle, one left, one right, two left, two right etc, which is done for all rows at once.
+    # Returns the position in the sorted grains arrays of each grain, given in fill order (row by row left to right)
+    row_of_grain = np.repeat(np.arange(row_lengths.size), row_lengths)
+    row_start = row_starts[row_of_grain]
+    position = np.arange(row_lengths.sum()) - row_start  # Position of each grain within its row
+    no_left = ((row_lengths - 1) // 2)[row_of_grain]        # Number of grains left of the middle grain
+
+    right = position - no_left     # Steps right of the middle grain, -ve for the left side
+    left = no_left - 1 - position  # Steps left of the grain left of the middle grain
+    rank = np.where(right >= 0, np.where(right < no_left, 2 * right, no_left + right), 2 * left + 1)
+    return row_start + rank
+
+
+def replaying():
+    # Returns True if the run is replayed from the timer recording (see timer_replay.py).  Only paced timer runs are
+    # replayed, a replay applies the whole run in a few ms so an unpaced one would show no falling sand
+    return g.mode == g.TIMING and g.timer_seconds != 0 and timer_replay.loaded_file is not None
+
+
+def select_engine():
+    # Returns the start/move/finish functions of the grain engine selected in my_globals.
+    # start(grains_x, grains_y, no_grains) - load the grain positions into the engine at the start of a run
+    # move(Direction) - move all grains one pass in the gravity direction, returns the number of grains moved
+    # finish(grains_x, grains_y) - save the grain positions and bring the hourglass image up to date at the end of a
+    # run, the display framebuffer is updated as the grains move
+    # Paced timer runs replay the recorded run for the current fill if there is one (see replaying())
+    if replaying():
+        return timer_replay.start, timer_replay.move_grains, timer_replay.finish
+    if g.engine == g.NUMPY_ENGINE:
+        return grains_numpy.start, grains_numpy.move_grains, grains_numpy.finish
+    if g.engine == g.ACTIVE_ENGINE:
+        return grains_active.start, grains_active.move_grains, grains_active.finish
+    if g.engine == g.FLAT_ENGINE:
+        return grains_flat.start, grains_flat.move_grains, grains_flat.finish
+    if g.engine == g.PARALLEL_ENGINE:
+        return grains_parallel.start, grains_parallel.move_grains, grains_parallel.finish
+    if g.engine == g.MARGOLUS_ENGINE:
+        return grains_margolus.start, grains_margolus.move_grains, grains_margolus.finish
+
+    return start_pixel_engine, move_grains, finish_pixel_engine
 
 
 def update_grains():
-    global pixels, sorted_grains_x, sorted_grains_y
     # Cycles through the grains to move them to the next available space either one below, lower left or lower right.
     # These checks are performed at all compass directionS - N/S/E/W/NE/NW/SE/SW
-    # The grain movement parameters are adjusted to account for the orientation of the hourglass to minimise 
-    # the later on processing. 
+    # The grain movement is carried out by the engine selected in my_globals, see move_grains() for the original.
     #
     # Function runs until there are no more grains to move or runs continuously
     # Algorithm is: try moving grain straight down first, if fails then attempt to move down at 45 deg (left and right checks).
     #
-    # To speed up processing only update the desplay every 'n' number of passes
+    # To speed up processing only update the desplay at up to g.display_fps frames per second (see frame_rate.py)
     
     update_count = 1 # set to 1 to get started on main loop
     # init stat variables - only valid if run during a standard timing run
     total_move_count = 0
     pass_count = 0
-    display_update = 0 # Used to limit screen updates to every other pass
+
+    start_engine, move_engine, finish_engine = select_engine()
+    # Engines mark the tiles they move grains in, so only those are sent to the display
+    dirty_tiles.reset(*g.image.size, sorted_grains_x, sorted_grains_y, g.no_grains)
+    start_engine(sorted_grains_x, sorted_grains_y, g.no_grains)
+    if g.gyro_sample_hz and g.mode == g.CONTINUOUS:
+        gyro_sampler.start()
+
+    # Timer runs are paced to take the required time once the number of passes is known (see pacing.py)
+    timer_run = g.mode == g.TIMING or g.mode == g.CAL
+    timing = g.mode == g.TIMING # A button press during a timer run goes back to the menu, which ends the run
+    paced = g.mode == g.TIMING and g.timer_seconds != 0 and g.timing_passes != 0
+    if paced:
+        pacing.start(g.timer_seconds, g.timing_passes)
+    else:
+        pacing.final_error = None
+
+    # Record the grain moves of every pass if required, replayed timer runs are already a recording
+    recording = g.record_dir is not None and grain_cells() is not None
+    if recording:
+        os.makedirs(g.record_dir, exist_ok=True)
+        recording_name = "{}-mode{}-engine{}.moves".format(time.strftime("%Y%m%d-%H%M%S"), g.mode, g.engine)
+        pass_recorder.start(os.path.join(g.record_dir, recording_name), grain_cells(), *g.image.size)
+
+    # Time each phase of every pass if required (see pass_profiler.py)
+    profiling = g.profile_passes != 0
+    if profiling:
+        pass_profiler.start(g.profile_passes)
+
+    # Continuous runs go idle once the grains have settled, until the direction changes (see quiescence.py)
+    idle_direction = None # Direction the grains settled in, None while the grains are moving
+    quiescence.start()
+    frame_rate.start()
 
     # Main loop to loop until there is no more grain movement (when being used as a timer) or to run continuously
     while (g.mode == g.CONTINUOUS) or not(update_count == 0):
+        if timing and g.mode != g.TIMING:
+            break # Button pressed, timer run cancelled
+        if profiling:
+            t_gyro = time.perf_counter()
         
-        update_count = 0 # Reset for current pass of the grains
-        toggle = True # Used to toggle checking left/right first
-        
-        # Get gyro direction 
-        Direction = read_gyro_xy() 
+        if g.mode == g.TIMING or g.mode == g.CAL:  # Force right way up if in timing mode
+            Direction = g.S
+        elif g.gyro_sample_hz:
+            # Latest gyro direction from the sampler thread
+            Direction = gyro_sampler.direction
+        else:
+            # Get gyro direction 
+            Direction = read_gyro_xy() 
     
         #print(Direction)
+        if idle_direction is not None:
+            if g.mode != g.CONTINUOUS:
+                break # Button pressed, the grains have already settled
+            if Direction == idle_direction:
+                quiescence.wait() # Still settled, nothing to move or display
+                continue
+            idle_direction = None
+            gyro_sampler.idle = False
 
-    # Down x/y are used for the inital test to see if can move directly below
-    # x/y left & right are used to check whether the can move 45 degrees left or right
-    # All number pairs are added to the 'grain' position for any testing
+        if profiling:
+            t_grains = time.perf_counter()
 
-        if Direction == g.S or g.mode == g.TIMING or g.mode == g.CAL:  # Force right way up if in timing mode
-            down_x = 0 # down x & y are to select next step down, ie straight down
-            down_y = 1 # +ve down
-            x_left = -1 # x/y left and right are used if 'down x/y' cant find a free spot.  
-            y_left = 1 # Change to down 45 deg
-            x_right = 1 # Change to down 45 deg
-            y_right = 1
-
-        elif Direction == g.SW:
-            down_x = -1 # down x & y are to select next step down, ie 45 deg for a tilt
-            down_y = 1 # +ve down
-            x_left = -2 # x/y left and right are used if 'down x/y' cant find a free spot.  
-            y_left = 0 # effectively up left 45 deg 
-            x_right = 0
-            y_right = 2
-
-        elif Direction == g.SE:
-            down_x = 1 # down x & y are to select next step down, ie 45 deg for a tilt
-            down_y = 1 # +ve down
-            x_left = 0 # x/y left and right are used if 'down x/y' cant find a free spot. 
-            y_left = 2 
-            x_right = 2 
-            y_right = 0 # effectively up right 45 deg
-
-        elif Direction == g.N: # Upside down
-            down_x = 0 # step x & y are to select next step down, ie straight down
-            down_y = -1 # -ve down
-            x_left = 1 # change to down 45 deg
-            y_left = -1 # change to down 45 deg
-            x_right = -1
-            y_right = -1
-
-        elif Direction == g.NE:
-            down_x = 1 # step x & y are to select next step down, ie 45 deg for a tilt
-            down_y = -1 # -ve down
-            x_left = 2 # x/y left and right are used if 'down x/y' cant find a free spot.  
-            y_left = 0 # effectively up left 45 deg
-            x_right = 0
-            y_right = -2
-
-        elif Direction == g.NW:
-            down_x = -1 # step x & y are to select next step down, ie 45 deg for a tilt
-            down_y = -1 # +ve down
-            x_left = 0 # x/y left and right are used if 'down x/y' cant find a free spot.
-            y_left = -2  
-            x_right = -2 
-            y_right = 0 # effectively up right 45 deg
-
-        elif Direction == g.W:
-            down_x = -1 
-            down_y = 0 
-            x_left = -1 
-            y_left = -1
-            x_right = -1
-            y_right = 1
-
-        elif Direction == g.E:
-            down_x = 1 
-            down_y = 0 
-            x_left = 1 
-            y_left = 1
-            x_right = 1
-            y_right = -1
-
-        elif Direction == g.FLAT: # Nothing to do....
-            down_x = 0
-            down_y = 0
-            x_left = 0 
-            x_right = 0
-            y_left = 0
-            y_right = 0            
-        
-        #print(Direction, step_x,step_y,x_left,x_right,y_left,y_right)
-
-        for i in range(0, g.no_grains-1):
-            # Check all grains in this pass
-            # Move grain down one pixel position, if possible, else down left or down right one position
-            # Note that this routine copes with any orientation of the hourglass by the settings of
-            # x/y step/left/right variables
-
-            # Get x & y of current grain
-            grain_x = sorted_grains_x[i]
-            grain_y = sorted_grains_y[i]
-
-            if toggle: # Check left first
-                # Check if next pixel down is free
-                if pixels[grain_x+down_x,grain_y+down_y] == (255,255,255): # white, ie empty
-                    # Delete original grain
-                    pixels[grain_x,grain_y] = (255,255,255) # write a white pixels to the local graphic for future collision checks.
-                    # Write new grain
-                    pixels[grain_x+down_x,grain_y+down_y] = (0,255,0) # write a green pixels to the local graphic for future collision checks.
-                    # Update new grain x,y in grains list
-                    sorted_grains_x[i] = grain_x+down_x
-                    sorted_grains_y[i] = grain_y+down_y
-                    update_count = update_count + 1  # indicate moved a grain
-                # Check left lower pixel
-                elif pixels[grain_x + x_left, grain_y + y_left] == (255,255,255): # white, ie empty
-                    # Delete original grain
-                    pixels[grain_x,grain_y] = (255,255,255) # write a white pixels to the local graphic for future collision checks.
-                    # Write new grain
-                    pixels[grain_x + x_left, grain_y + y_left] = (0,255,0) # write a green pixels to the local graphic for future collision checks.
-                    # Update new grain x,y in grains list
-                    sorted_grains_x[i] = grain_x + x_left
-                    sorted_grains_y[i] = grain_y + y_left
-                    update_count = update_count + 1  # indicate moved a grain
-                # Check right lower pixel
-                elif pixels[grain_x + x_right, grain_y + y_right] == (255,255,255): # white, ie empty
-                    # Delete original grain
-                    pixels[grain_x,grain_y] = (255,255,255) # write a white pixels to the local graphic for future collision checks.
-                    # Write new grain
-                    pixels[grain_x + x_right, grain_y + y_right] = (0,255,0) # write a green pixels to the local graphic for future collision checks.
-                    # Update new grain x,y in grains list
-                    sorted_grains_x[i] = grain_x + x_right
-                    sorted_grains_y[i] = grain_y + y_right
-                    update_count = update_count + 1  # indicate moved a grain
-            else: # Check right 
-                # Check if next pixel down is free
-                if pixels[grain_x+down_x,grain_y+down_y] == (255,255,255): # white, ie empty
-                    # Delete original grain
-                    pixels[grain_x,grain_y] = (255,255,255) # write a white pixels to the local graphic for future collision checks.
-                    # Write new grain
-                    pixels[grain_x+down_x,grain_y+down_y] = (0,255,0) # write a green pixels to the local graphic for future collision checks.
-                    # Update new grain x,y in grains list
-                    sorted_grains_x[i] = grain_x+down_x
-                    sorted_grains_y[i] = grain_y+down_y
-                    update_count = update_count + 1  # indicate moved a grain
-                # Check right lower pixel
-                elif pixels[grain_x + x_right, grain_y + y_right] == (255,255,255): # white, ie empty
-                    # Delete original grain
-                    pixels[grain_x,grain_y] = (255,255,255) # write a white pixels to the local graphic for future collision checks.
-                    # Write new grain
-                    pixels[grain_x + x_right, grain_y + y_right] = (0,255,0) # write a green pixels to the local graphic for future collision checks.
-                    # Update new grain x,y in grains list
-                    sorted_grains_x[i] = grain_x + x_right
-                    sorted_grains_y[i] = grain_y + y_right
-                    update_count = update_count + 1  # indicate moved a grain
-                # Check left lower pixel
-                elif pixels[grain_x + x_left, grain_y + y_left] == (255,255,255): # white, ie empty
-                    # Delete original grain
-                    pixels[grain_x,grain_y] = (255,255,255) # write a white pixels to the local graphic for future collision checks.
-                    # Write new grain
-                    pixels[grain_x + x_left, grain_y + y_left] = (0,255,0) # write a green pixels to the local graphic for future collision checks.
-                    # Update new grain x,y in grains list
-                    sorted_grains_x[i] = grain_x + x_left
-                    sorted_grains_y[i] = grain_y + y_left
-                    update_count = update_count + 1  # indicate moved a grain
-            
-            toggle = not toggle # Swap for next time
+        update_count = move_engine(Direction)
 
         pass_count = pass_count + 1
         total_move_count = total_move_count + update_count # Add count for the current pass
+        if recording:
+            pass_recorder.record(grain_cells(), Direction)
         #print(pass_count, total_move_count, update_count)
+        if profiling:
+            t_display = time.perf_counter()
+
+        if frame_rate.due():  # Skip the display update if the last frame was too recent to improve performance
+            # Update screen to display all grains moved since the last update
+            dirty_tiles.flush()  # update changed parts of the hourglass only, the engines keep the framebuffer up to date
+        if profiling:
+            t_sleep = time.perf_counter()
+
+        # Don't delay in continuous mode or if the number of passes isn't known yet
+        if paced and g.mode == g.TIMING:
+            pacing.wait(pass_count)
+        if profiling:
+            pass_profiler.record(t_gyro, t_grains, t_display, t_sleep, time.perf_counter(), update_count)
+
+        if g.mode == g.CONTINUOUS and g.idle_poll_hz and quiescence.settled(update_count, Direction):
+            dirty_tiles.flush() # Bring the display up to date, then stop until the direction changes
+            idle_direction = Direction
+            gyro_sampler.idle = True
+
+    gyro_sampler.idle = False
+    gyro_sampler.stop() # No direction needed until the next continuous run
+    frame_rate.finish()
+    dirty_tiles.flush() # Send any moves since the last frame
+    display_worker.wait() # Let the last display update finish before anything else uses the display
+    if recording:
+        pass_recorder.finish()
+    if profiling and g.profile_export is not None:
+        pass_profiler.export(g.profile_export)
+    if paced and g.mode == g.TIMING:
+        pacing.finish() # Not for a cancelled run, final_error stays None
+    if timer_run and (g.mode == g.TIMING or g.mode == g.CAL):
+        g.timing_passes = pass_count # Run completed, used to pace the next timer run
+    finish_engine(sorted_grains_x, sorted_grains_y)
+
+    return total_move_count, pass_count
+
+
+def grain_cells():
+    # Returns the current cell (y * width + x of the hourglass graphic) of each grain, in sorted grain order, as a
+    # NumPy array.  Returns None for the timer replay as it doesn't track the grains
+    if replaying():
+        return None
+    if g.engine == g.NUMPY_ENGINE:
+        return grains_numpy.pos
+    if g.engine == g.PARALLEL_ENGINE:
+        return grains_parallel.pos
+    if g.engine == g.MARGOLUS_ENGINE:
+        return grains_margolus.pos
+    if g.engine == g.FLAT_ENGINE:
+        return np.array(grains_flat.pos, dtype=np.int32)
+
+    # The original and active engines move the grains in the sorted grains arrays
+    grains_y = np.frombuffer(sorted_grains_y, dtype=np.uint16)[:g.no_grains].astype(np.int32)
+    return grains_y * g.image.size[0] + np.frombuffer(sorted_grains_x, dtype=np.uint16)[:g.no_grains]
+
+
+def start_pixel_engine(grains_x, grains_y, no_grains):
+    # The original engine works directly on the sorted grains arrays and the pixel graphic so nothing to load
+    pass
+
+
+def finish_pixel_engine(grains_x, grains_y):
+    # Nothing to save, the sorted grains arrays and pixel graphic are already up to date
+    pass
+
+
+def move_grains(Direction):
+    global pixels, sorted_grains_x, sorted_grains_y
+    # Original engine - moves each grain in turn using the pixel graphic for collision checks.
+    # The grain movement parameters are adjusted to account for the orientation of the hourglass to minimise 
+    # the later on processing. 
+    # Returns the number of grains moved in this pass
 
-        if display_update == 10:  # Delay update for 'n' passes to improve performance
-            # Update screen to display all grains moved this pass
-            g.st7789.display(g.image, g.hg_tl_x,g.hg_tl_y,g.hg_br_x,g.hg_br_y)  # update hourglass image only
-            display_update = 0
-        display_update = display_update + 1
-
-        # Don't delay in continuous mode or if no cal has been run        
-        if g.pass_delay != 0 and not g.mode == g.CONTINUOUS:
-            time.sleep((g.pass_delay-0.012)) # subtracted 12ms fudge factor to cal!!
+    update_count = 0 # Reset for current pass of the grains
+    toggle = True # Used to toggle checking left/right first
 
-    return total_move_count, pass_count
\ No newline at end of file
+    # Down x/y are used for the inital test to see if can move directly below
+    # x/y left & right are used to check whether the can move 45 degrees left or right
+    # All number pairs are added to the 'grain' position for any testing
+    down_x, down_y, x_left, y_left, x_right, y_right = g.MOVE_OFFSETS[Direction]
+
+    #print(Direction, down_x, down_y, x_left, x_right, y_left, y_right)
+
+    for i in range(0, g.no_grains):
+        # Check all grains in this pass
+        # Move grain down one pixel position, if possible, else down left or down right one position
+        # Note that this routine copes with any orientation of the hourglass by the settings of
+        # x/y step/left/right variables
+
+        # Get x & y of current grain
+        grain_x = sorted_grains_x[i]
+        grain_y = sorted_grains_y[i]
+
+        if toggle: # Check left first
+            # Check if next pixel down is free
+            if pixels[grain_x+down_x,grain_y+down_y] == (255,255,255): # white, ie empty
+                # Delete original grain
+                pixels[grain_x,grain_y] = (255,255,255) # write a white pixels to the local graphic for future collision checks.
+                # Write new grain
+                pixels[grain_x+down_x,grain_y+down_y] = (0,255,0) # write a green pixels to the local graphic for future collision checks.
+                # Update new grain x,y in grains list
+                sorted_grains_x[i] = grain_x+down_x
+                sorted_grains_y[i] = grain_y+down_y
+                update_count = update_count + 1  # indicate moved a grain
+            # Check left lower pixel
+            elif pixels[grain_x + x_left, grain_y + y_left] == (255,255,255): # white, ie empty
+                # Delete original grain
+                pixels[grain_x,grain_y] = (255,255,255) # write a white pixels to the local graphic for future collision checks.
+                # Write new grain
+                pixels[grain_x + x_left, grain_y + y_left] = (0,255,0) # write a green pixels to the local graphic for future collision checks.
+                # Update new grain x,y in grains list
+                sorted_grains_x[i] = grain_x + x_left
+                sorted_grains_y[i] = grain_y + y_left
+                update_count = update_count + 1  # indicate moved a grain
+            # Check right lower pixel
+            elif pixels[grain_x + x_right, grain_y + y_right] == (255,255,255): # white, ie empty
+                # Delete original grain
+                pixels[grain_x,grain_y] = (255,255,255) # write a white pixels to the local graphic for future collision checks.
+                # Write new grain
+                pixels[grain_x + x_right, grain_y + y_right] = (0,255,0) # write a green pixels to the local graphic for future collision checks.
+                # Update new grain x,y in grains list
+                sorted_grains_x[i] = grain_x + x_right
+                sorted_grains_y[i] = grain_y + y_right
+                update_count = update_count + 1  # indicate moved a grain
+        else: # Check right 
+            # Check if next pixel down is free
+            if pixels[grain_x+down_x,grain_y+down_y] == (255,255,255): # white, ie empty
+                # Delete original grain
+                pixels[grain_x,grain_y] = (255,255,255) # write a white pixels to the local graphic for future collision checks.
+                # Write new grain
+                pixels[grain_x+down_x,grain_y+down_y] = (0,255,0) # write a green pixels to the local graphic for future collision checks.
+                # Update new grain x,y in grains list
+                sorted_grains_x[i] = grain_x+down_x
+                sorted_grains_y[i] = grain_y+down_y
+                update_count = update_count + 1  # indicate moved a grain
+            # Check right lower pixel
+            elif pixels[grain_x + x_right, grain_y + y_right] == (255,255,255): # white, ie empty
+                # Delete original grain
+                pixels[grain_x,grain_y] = (255,255,255) # write a white pixels to the local graphic for future collision checks.
+                # Write new grain
+                pixels[grain_x + x_right, grain_y + y_right] = (0,255,0) # write a green pixels to the local graphic for future collision checks.
+                # Update new grain x,y in grains list
+                sorted_grains_x[i] = grain_x + x_right
+                sorted_grains_y[i] = grain_y + y_right
+                update_count = update_count + 1  # indicate moved a grain
+            # Check left lower pixel
+            elif pixels[grain_x + x_left, grain_y + y_left] == (255,255,255): # white, ie empty
+                # Delete original grain
+                pixels[grain_x,grain_y] = (255,255,255) # write a white pixels to the local graphic for future collision checks.
+                # Write new grain
+                pixels[grain_x + x_left, grain_y + y_left] = (0,255,0) # write a green pixels to the local graphic for future collision checks.
+                # Update new grain x,y in grains list
+                sorted_grains_x[i] = grain_x + x_left
+                sorted_grains_y[i] = grain_y + y_left
+                update_count = update_count + 1  # indicate moved a grain
+
+        if sorted_grains_x[i] != grain_x or sorted_grains_y[i] != grain_y:
+            # Grain moved, update the display framebuffer ready for the next display update
+            dirty_tiles.move_grain(i, grain_x, grain_y, sorted_grains_x[i], sorted_grains_y[i])
+
+        toggle = not toggle # Swap for next time
+
+    return update_count
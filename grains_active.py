@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : grains_active.py
+# Description :	Active set grain engine - same rules and grain order as the original engine
+#               but only grains that could move are checked on each pass
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import heapq
+
+# Import application modules
+import my_globals as g
+import dirty_tiles
+
+# A grain that could not move stays blocked until one of the three cells it checks (down, left, right) is freed,
+# as the walls never change and another grain arriving can only block it further.  So after a failed check a grain
+# is dropped from the active set and only added back when a neighbouring grain moves away or the gravity direction
+# changes.  Late in a timing run only the few grains near the neck are active so a pass costs very little.
+
+pixels = None     # Pixel graphic object, used for collision checks as per the original engine
+grains_x = None   # Sorted grains arrays, updated in place
+grains_y = None
+no_grains = 0
+width = 0         # Width of the hourglass graphic, used for the linear cell index
+owner = None      # Index of the grain in each cell (y * width + x), -1 if no grain
+active = set()    # Grains to check on the next pass
+last_direction = None
+
+
+def start(sorted_x, sorted_y, grain_count):
+    global pixels, grains_x, grains_y, no_grains, width, owner, active, last_direction
+    # Load the grain positions and make every grain active for the first pass
+
+    pixels = g.image.load()
+    width, height = g.image.size
+    grains_x = sorted_x
+    grains_y = sorted_y
+    no_grains = grain_count
+
+    owner = [-1] * (width * height)
+    for i in range(0, no_grains):
+        owner[grains_y[i] * width + grains_x[i]] = i
+
+    active = set(range(0, no_grains))
+    last_direction = None
+
+
+def move_grains(Direction):
+    global active, last_direction
+    # Moves the active grains one pass in the gravity direction, in grain order with the same left/right
+    # toggle as the original engine so the grain movement is identical.
+    # Returns the number of grains moved in this pass
+
+    if Direction != last_direction:
+        # Every grain may be able to move in the new direction
+        active = set(range(0, no_grains))
+        last_direction = Direction
+
+    down_x, down_y, x_left, y_left, x_right, y_right = g.MOVE_OFFSETS[Direction]
+    # Linear cell offsets used to find the grains that check a freed cell
+    offsets = (down_y * width + down_x, y_left * width + x_left, y_right * width + x_right)
+    left_first = ((down_x, down_y), (x_left, y_left), (x_right, y_right))
+    right_first = ((down_x, down_y), (x_right, y_right), (x_left, y_left))
+
+    screen = dirty_tiles.screen # Local names are quicker in the loop
+    grain_colour = dirty_tiles.grain_colour
+    dirty = dirty_tiles.dirty
+    cell_tile = dirty_tiles.cell_tile
+    update_count = 0
+    this_pass = sorted(active) # A sorted list is already a valid heap
+    scheduled = active         # Grains still to be checked on this pass (or already checked)
+    next_active = set()
+
+    while this_pass:
+        i = heapq.heappop(this_pass)
+        grain_x = grains_x[i]
+        grain_y = grains_y[i]
+
+        # Even grains check left first, odd grains right first, as per the original 'toggle'
+        for move_x, move_y in (left_first if (i & 1) == 0 else right_first):
+            if pixels[grain_x + move_x, grain_y + move_y] == (255,255,255): # white, ie empty
+                pixels[grain_x, grain_y] = (255,255,255) # Delete original grain
+                pixels[grain_x + move_x, grain_y + move_y] = (0,255,0) # Write new grain
+                grains_x[i] = grain_x + move_x
+                grains_y[i] = grain_y + move_y
+
+                freed = grain_y * width + grain_x
+                target = freed + move_y * width + move_x
+                owner[freed] = -1
+                owner[target] = i
+                screen[grain_y, grain_x] = g.BACKGROUND_INDEX # Update the display framebuffer
+                screen[grain_y + move_y, grain_x + move_x] = grain_colour[i]
+                dirty[cell_tile[freed]] = 1 # Flag the display tiles for the next update
+                dirty[cell_tile[target]] = 1
+                next_active.add(i) # Keep going next pass
+                update_count = update_count + 1
+
+                # Wake up the grains that check the freed cell.  Later grains are checked on this pass, as they
+                # would be in the original engine, earlier grains have already had their turn so wait for the next.
+                for offset in offsets:
+                    j = owner[freed - offset]
+                    if j > i:
+                        if j not in scheduled:
+                            heapq.heappush(this_pass, j)
+                            scheduled.add(j)
+                    elif j >= 0:
+                        next_active.add(j)
+                break
+
+    active = next_active
+    return update_count
+
+
+def finish(sorted_x, sorted_y):
+    # Nothing to save, the sorted grains arrays and pixel graphic are already up to date
+    pass
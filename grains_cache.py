@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : grains_cache.py
+# Description :	On-disk cache of the analysed hourglass graphic and the filled grains so that
+#               returning to the menu (or a cold boot) doesn't have to re-scan the graphic pixels.
+#               Also keeps the number of passes a timer run takes, used to pace timer runs
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import hashlib
+import os
+import zipfile
+from array import array
+
+import numpy as np
+from PIL import Image
+
+# Import application modules
+import my_globals as g
+import grains
+
+CACHE_DIR = "cache"  # Relative to the working directory, as per the hourglass graphic
+CACHE_VERSION = 1    # Change if the cache contents or fill algorithm change
+
+# Hourglass interior bounds saved in the cache
+BOUNDS = ('HOURGLASS_TOP_Y', 'HOURGLASS_BOTTOM_Y', 'HOURGLASS_CENTRE_Y', 'HOURGLASS_CENTRE_X',
+          'HOURGLASS_WIDTH', 'HOURGLASS_HEIGHT')
+
+
+def cache_file(graphic_file):
+    # Cache file name, keyed by the graphic's content and the fill parameters
+    with open(graphic_file, 'rb') as f:
+        key = hashlib.sha1(f.read())
+    key.update("{} {} {} {}".format(CACHE_VERSION, grains.NO_GRAIN_ROWS, g.fill_grains, g.max_grains).encode())
+    return os.path.join(CACHE_DIR, "hourglass-{}.npz".format(key.hexdigest()))
+
+
+def load(graphic_file):
+    # Load the analysed graphic, grains and filled image from the cache and display the filled hourglass.
+    # Returns False if there is no (valid) cache entry, in which case the graphic needs analysing and filling
+    filename = cache_file(graphic_file)
+    if not os.path.exists(filename):
+        return False
+
+    try:
+        with np.load(filename) as cache:
+            bounds = cache['bounds']
+            no_grains = int(cache['no_grains'])
+            capacity = int(cache['capacity'])
+            grains_xy = cache['grains']
+            image = cache['image']
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return False # Treat a damaged cache file as a miss, it will be overwritten
+
+    for name, value in zip(BOUNDS, bounds):
+        setattr(grains, name, int(value))
+
+    # Grains arrays are stored as 4 rows (grains x/y then sorted grains x/y) of the filled grains only
+    grains_arrays = []
+    for row in grains_xy:
+        grains_array = array('H', bytes(2 * capacity))
+        np.frombuffer(grains_array, dtype=np.uint16)[:no_grains] = row
+        grains_arrays.append(grains_array)
+    grains.grains_x, grains.grains_y, grains.sorted_grains_x, grains.sorted_grains_y = grains_arrays
+    g.no_grains = no_grains
+
+    g.image = Image.fromarray(image, 'RGB')
+    grains.pixels = g.image.load()
+    grains.display_hourglass()  # update hourglass image (inc grains) only
+    return True
+
+
+def save(graphic_file):
+    # Save the analysed graphic, grains and filled image, after analyse_hourglass_graphic() and fill_hourglass()
+    filename = cache_file(graphic_file)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    no_grains = g.no_grains
+    grains_xy = np.array([np.frombuffer(grains_array, dtype=np.uint16)[:no_grains] for grains_array in
+                          (grains.grains_x, grains.grains_y, grains.sorted_grains_x, grains.sorted_grains_y)])
+
+    # Write to a temporary file first so a power cut can't leave a half written cache file
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, 'wb') as f:
+        np.savez_compressed(f,
+                            bounds=np.array([getattr(grains, name) for name in BOUNDS], dtype=np.int32),
+                            no_grains=no_grains,
+                            capacity=len(grains.grains_x),
+                            grains=grains_xy,
+                            image=np.array(g.image.convert('RGB')))
+    os.replace(temp_filename, filename)
+
+
+def passes_file(graphic_file):
+    # Timer run passes file, per engine as the engines can take a slightly different number of passes
+    return "{}-engine{}.passes".format(os.path.splitext(cache_file(graphic_file))[0], g.engine)
+
+
+def load_passes(graphic_file):
+    # Returns the number of passes a timer run takes for the current fill and engine, 0 if not known
+    try:
+        with open(passes_file(graphic_file)) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+
+def save_passes(graphic_file, passes):
+    # Save the number of passes a timer run takes, if known and not already saved
+    if passes == 0 or passes == load_passes(graphic_file):
+        return
+    filename = passes_file(graphic_file)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(filename + ".tmp", 'w') as f:
+        f.write("{}\n".format(passes))
+    os.replace(filename + ".tmp", filename)
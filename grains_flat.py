@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : grains_flat.py
+# Description :	Flat grid grain engine - original engine loop, but with the hourglass occupancy held
+#               in a flat bytearray and each gravity direction mapped to linear cell offsets
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+from PIL import Image
+
+# Import application modules
+import my_globals as g
+import dirty_tiles
+
+# Occupancy grid cell values - empty is 0 so a free cell test is just 'not grid[cell]'
+EMPTY = 0
+WALL = 1
+GRAIN = 2
+
+# Translation tables to turn the grid into image masks for rendering
+EMPTY_MASK = bytes([255] + [0] * 255)
+GRAIN_MASK = bytes([0, 0, 255] + [0] * 253)
+
+grid = None     # Occupancy of the hourglass box (g.hg_tl_x,g.hg_tl_y to g.hg_br_x,g.hg_br_y), one byte per pixel
+pos = None      # Linear grid position (y * width + x) of each grain, in sorted grain order
+width = 0       # Width of the hourglass box
+height = 0      # Height of the hourglass box
+LINEAR_OFFSETS = None # (down, left, right) linear cell offsets for each gravity direction
+
+
+def start(grains_x, grains_y, no_grains):
+    global grid, pos, width, height, LINEAR_OFFSETS
+    # Build the occupancy grid from the hourglass graphic, which covers the hourglass box on the screen,
+    # and convert the grain positions and move offsets to linear cell indexes
+
+    width, height = g.image.size # Graphic is displayed at g.hg_tl_x,g.hg_tl_y so covers the hourglass box
+    pixels = g.image.load()
+
+    grid = bytearray(width * height)
+    for y in range(0, height):
+        for x in range(0, width):
+            pixel = pixels[x, y]
+            if pixel == (0,255,0): # green, ie grain
+                grid[y * width + x] = GRAIN
+            elif pixel != (255,255,255): # Anything other than the white background is part of the hourglass
+                grid[y * width + x] = WALL
+
+    pos = [grains_y[i] * width + grains_x[i] for i in range(0, no_grains)]
+
+    LINEAR_OFFSETS = []
+    for down_x, down_y, x_left, y_left, x_right, y_right in g.MOVE_OFFSETS:
+        LINEAR_OFFSETS.append((down_y * width + down_x, y_left * width + x_left, y_right * width + x_right))
+
+
+def move_grains(Direction):
+    # Moves each grain in turn, same rules and order as the original engine.
+    # Returns the number of grains moved in this pass
+
+    if Direction == g.FLAT:
+        return 0 # Nothing to do....
+
+    down, left, right = LINEAR_OFFSETS[Direction]
+    cells = grid    # Local names are quicker in the loop
+    positions = pos
+    screen = dirty_tiles.screen
+    grain_colour = dirty_tiles.grain_colour
+    dirty = dirty_tiles.dirty
+    cell_tile = dirty_tiles.cell_tile
+    update_count = 0
+    toggle = True # Used to toggle checking left/right first
+
+    for i in range(0, len(positions)):
+        cell = positions[i]
+
+        if not cells[cell + down]: # Check if next cell down is free
+            target = cell + down
+        elif toggle:
+            if not cells[cell + left]: # Check left lower cell
+                target = cell + left
+            elif not cells[cell + right]: # Check right lower cell
+                target = cell + right
+            else:
+                toggle = False
+                continue
+        else:
+            if not cells[cell + right]: # Check right lower cell
+                target = cell + right
+            elif not cells[cell + left]: # Check left lower cell
+                target = cell + left
+            else:
+                toggle = True
+                continue
+
+        cells[cell] = EMPTY
+        cells[target] = GRAIN
+        positions[i] = target
+        screen[divmod(cell, width)] = g.BACKGROUND_INDEX # Update the display framebuffer
+        screen[divmod(target, width)] = grain_colour[i]
+        dirty[cell_tile[cell]] = 1 # Flag the display tiles for the next update
+        dirty[cell_tile[target]] = 1
+        update_count = update_count + 1
+        toggle = not toggle # Swap for next time
+
+    return update_count
+
+
+def render():
+    # Write the grid into the hourglass image, the walls are left untouched
+    size = (width, height)
+    g.image.paste((255,255,255), (0, 0), Image.frombytes('L', size, bytes(grid.translate(EMPTY_MASK))))
+    g.image.paste((0,255,0), (0, 0), Image.frombytes('L', size, bytes(grid.translate(GRAIN_MASK))))
+
+
+def finish(grains_x, grains_y):
+    # Save the grain positions back to the sorted grains arrays and bring the image up to date
+    for i in range(0, len(pos)):
+        grains_y[i], grains_x[i] = divmod(pos[i], width)
+    render()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : grains_margolus.py
+# Description :	Block cellular automaton grain engine - the hourglass is split into 2x2 blocks (Margolus
+#               neighbourhood), with the blocks shifted by one cell diagonally every other pass.  Each block
+#               is updated from a lookup table of its contents for the gravity direction, so every block is
+#               moved at once with NumPy and the number of grains can't change.
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import numpy as np
+from PIL import Image
+
+# Import application modules
+import my_globals as g
+import dirty_tiles
+
+# Cell values, a block's contents is coded as TL + 3 * TR + 9 * BL + 27 * BR
+EMPTY = 0
+GRAIN = 1
+WALL = 2
+BLOCK_CELLS = ((0, 0), (1, 0), (0, 1), (1, 1)) # x,y of each cell of a block - TL, TR, BL, BR
+NO_CODES = 3 ** 4
+
+WHITE = (255, 255, 255) # Background colour
+GREEN = (0, 255, 0)     # Grain colour
+
+
+def block_rules(Direction, prefer):
+    # Returns the new contents, the cell each cell's contents came from and the number of grains moved for every
+    # block contents, for the gravity direction.  Same rules as the original engine within the block - each grain
+    # moves straight down if it can, otherwise to the lower cell at 45 deg, with 'prefer' (the original left or right
+    # move offset) choosing between two equally low cells.  The lowest grains are moved first
+    down_x, down_y = g.MOVE_OFFSETS[Direction][:2]
+    new_codes = np.arange(NO_CODES, dtype=np.uint8)
+    sources = np.tile(np.arange(4, dtype=np.uint8), (NO_CODES, 1))
+    moves = np.zeros(NO_CODES, dtype=np.uint8)
+    if Direction == g.FLAT:
+        return new_codes, sources, moves # Nothing moves....
+
+    def depth(cell):
+        # How far down the cell is in the gravity direction
+        return BLOCK_CELLS[cell][0] * down_x + BLOCK_CELLS[cell][1] * down_y
+
+    def preference(cell, target):
+        # How well the move from cell to target matches the preferred direction
+        return ((BLOCK_CELLS[target][0] - BLOCK_CELLS[cell][0]) * prefer[0] +
+                (BLOCK_CELLS[target][1] - BLOCK_CELLS[cell][1]) * prefer[1])
+
+    def is_down(cell, target):
+        return (BLOCK_CELLS[target][0] - BLOCK_CELLS[cell][0], BLOCK_CELLS[target][1] - BLOCK_CELLS[cell][1]) == (down_x, down_y)
+
+    for code in range(0, NO_CODES):
+        cells = [(code // 3 ** cell) % 3 for cell in range(0, 4)]
+        source = [0, 1, 2, 3]
+        # Straight down moves first, then the 45 deg moves, as the original engine tries down before left/right
+        for straight_down in (True, False):
+            order = sorted((cell for cell in range(0, 4) if cells[cell] == GRAIN),
+                           key=lambda cell: (-depth(cell), -preference(0, cell)))
+            for cell in order:
+                free = [target for target in range(0, 4) if cells[target] == EMPTY and depth(target) > depth(cell)
+                        and (is_down(cell, target) or not straight_down)]
+                if not free:
+                    continue
+                target = max(free, key=lambda target: (depth(target), preference(cell, target)))
+                # Swap the grain into the empty cell
+                cells[cell], cells[target] = EMPTY, GRAIN
+                source[cell], source[target] = source[target], source[cell]
+                moves[code] = moves[code] + 1
+        new_codes[code] = cells[0] + 3 * cells[1] + 9 * cells[2] + 27 * cells[3]
+        sources[code] = source
+
+    return new_codes, sources, moves
+
+
+# Lookup tables for each gravity direction, for the original 'left' (0) and 'right' (1) preference
+NEW_CODE = np.zeros((len(g.MOVE_OFFSETS), 2, NO_CODES), dtype=np.uint8)
+SOURCE = np.zeros((len(g.MOVE_OFFSETS), 2, NO_CODES, 4), dtype=np.uint8)
+MOVES = np.zeros((len(g.MOVE_OFFSETS), 2, NO_CODES), dtype=np.uint8)
+for _direction, (_down_x, _down_y, _x_left, _y_left, _x_right, _y_right) in enumerate(g.MOVE_OFFSETS):
+    NEW_CODE[_direction, 0], SOURCE[_direction, 0], MOVES[_direction, 0] = block_rules(_direction, (_x_left, _y_left))
+    NEW_CODE[_direction, 1], SOURCE[_direction, 1], MOVES[_direction, 1] = block_rules(_direction, (_x_right, _y_right))
+# Cell values of each block contents, in block cell order
+DECODE = np.array([[(code // 3 ** cell) % 3 for cell in range(0, 4)] for code in range(0, NO_CODES)], dtype=np.uint8)
+
+grid = None      # Flattened occupancy grid of the hourglass graphic with a wall border, padded to an even size
+owner = None     # Flattened grid holding the index of the grain in each cell, -1 if no grain
+pos = None       # Linear position (y * width + x of the hourglass graphic) of each grain, in sorted grain order
+blocks = None    # For each block offset, (4, blocks) grid indexes of the cells of every block
+image_cell = None # Hourglass graphic cell (y * width + x) of each grid cell, and its x, y
+cell_x = None
+cell_y = None
+cell_tile = None  # Dirty tile index of each grid cell
+width = 0        # Width of the hourglass graphic
+background = None # RGB copy of the hourglass graphic with the grains removed, used for rendering
+pass_no = 0
+
+dirty = None     # NumPy view of the dirty display tiles
+screen = None    # Hourglass box of the display framebuffer
+
+
+def start(grains_x, grains_y, no_grains):
+    global grid, owner, pos, blocks, image_cell, cell_x, cell_y, cell_tile, width, background, pass_no, dirty, screen
+    # Build the occupancy grid from the hourglass graphic, with a wall border so blocks at the edge never move
+    # grains off the graphic, and find the cells of every block for both block offsets
+
+    rgb = np.array(g.image.convert('RGB'))
+    height, width = rgb.shape[:2]
+    white = np.all(rgb == WHITE, axis=2)
+    green = np.all(rgb == GREEN, axis=2)
+
+    grid_height = height + 2 + (height & 1)
+    grid_width = width + 2 + (width & 1)
+    cells = np.full((grid_height, grid_width), WALL, dtype=np.uint8)
+    inside = cells[1:height + 1, 1:width + 1]
+    inside[white] = EMPTY
+    inside[green] = GRAIN
+    grid = cells.ravel()
+
+    pos = (np.array(grains_y[:no_grains], dtype=np.int32) * width) + np.array(grains_x[:no_grains], dtype=np.int32)
+    grid_y, grid_x = np.divmod(pos, width)
+    owner = np.full(grid.size, -1, dtype=np.int32)
+    owner[(grid_y + 1) * grid_width + grid_x + 1] = np.arange(no_grains, dtype=np.int32)
+
+    # Cells of every block, the odd offset blocks leave out the outer border cells which are always walls
+    blocks = []
+    for offset in (0, 1):
+        top_left = np.add.outer(np.arange(offset, grid_height - 1, 2) * grid_width,
+                                np.arange(offset, grid_width - 1, 2)).ravel()
+        blocks.append(np.array([top_left + x + y * grid_width for x, y in BLOCK_CELLS], dtype=np.int32))
+
+    grid_y, grid_x = np.divmod(np.arange(grid.size, dtype=np.int32), grid_width)
+    cell_y = grid_y - 1 # Only used for cells inside the border
+    cell_x = grid_x - 1
+    image_cell = cell_y * width + cell_x
+    cell_tile = (cell_y >> dirty_tiles.TILE_SHIFT) * dirty_tiles.tiles_across + (cell_x >> dirty_tiles.TILE_SHIFT)
+
+    background = rgb.copy()
+    background[green] = WHITE
+    pass_no = 0
+
+    dirty = np.frombuffer(dirty_tiles.dirty, dtype=np.uint8)
+    screen = dirty_tiles.screen
+
+
+def move_grains(Direction):
+    global pass_no
+    # Moves all grains one pass in the gravity direction by updating every block at once from the lookup tables.
+    # The block offset alternates every pass, and the left/right preference every other pass, so grains move across
+    # block edges and don't drift one way.  A settled hourglass can still have grains to move with the other offset,
+    # so if nothing moves the next passes are tried straight away - no moves means the grains have settled.
+    # Returns the number of grains moved in this pass
+
+    if Direction == g.FLAT or pos.size == 0:
+        return 0 # Nothing to do....
+
+    for _ in range(0, 4):
+        offset = pass_no & 1
+        prefer = (pass_no >> 1) & 1
+        pass_no = pass_no + 1
+
+        cells = blocks[offset]
+        contents = grid[cells]
+        codes = contents[0] + 3 * contents[1] + 9 * contents[2] + 27 * contents[3]
+        new_codes = NEW_CODE[Direction, prefer][codes]
+        changed = np.flatnonzero(new_codes != codes)
+        if changed.size:
+            break
+    else:
+        return 0
+
+    # Move the grains (and their indexes) within the changed blocks
+    codes = codes[changed]
+    cells = cells[:, changed]
+    old = contents[:, changed]
+    new = DECODE[new_codes[changed]].T
+    sources = SOURCE[Direction, prefer][codes].T
+    owner[cells] = np.take_along_axis(owner[cells], sources, axis=0)
+    grid[cells] = new
+
+    # Update the grain positions and the display framebuffer for the cells that changed
+    moved = old != new
+    cleared = cells[moved & (new == EMPTY)]
+    filled = cells[moved & (new == GRAIN)]
+    pos[owner[filled]] = image_cell[filled]
+    screen[cell_y[cleared], cell_x[cleared]] = g.BACKGROUND_INDEX
+    screen[cell_y[filled], cell_x[filled]] = dirty_tiles.grain_colour[owner[filled]]
+    dirty[cell_tile[cleared]] = 1 # Flag the display tiles for the next update
+    dirty[cell_tile[filled]] = 1
+
+    return int(MOVES[Direction, prefer][codes].sum())
+
+
+def render():
+    # Write the grains into the hourglass image
+    rgb = background.copy()
+    rgb.reshape(-1, 3)[pos] = GREEN
+    g.image.paste(Image.fromarray(rgb, 'RGB'))
+
+
+def finish(grains_x, grains_y):
+    # Save the grain positions back to the sorted grains arrays and bring the image up to date
+    np.frombuffer(grains_x, dtype=np.uint16)[:pos.size] = pos % width
+    np.frombuffer(grains_y, dtype=np.uint16)[:pos.size] = pos // width
+    render()
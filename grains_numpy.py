@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : grains_numpy.py
+# Description :	Vectorised grain engine - keeps the hourglass occupancy as a NumPy grid
+#               and moves all of the grains for a pass with array operations
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import numpy as np
+from PIL import Image
+
+# Import application modules
+import my_globals as g
+import dirty_tiles
+
+# Occupancy grid cell values
+EMPTY = 0
+WALL = 1
+GRAIN = 2
+
+WHITE = (255, 255, 255) # Background colour
+GREEN = (0, 255, 0)     # Grain colour
+
+grid = None     # Flattened occupancy grid of the hourglass graphic, one byte per pixel
+owner = None    # Flattened grid holding the index of the grain in each cell, -1 if no grain
+pos = None      # Linear grid position (y * width + x) of each grain, in sorted grain order
+width = 0       # Width of the hourglass graphic
+background = None # RGB copy of the hourglass graphic with the grains removed, used for rendering
+
+dirty = None     # NumPy view of the dirty display tiles
+cell_tile = None # Dirty tile index of each grid cell
+screen = None    # Hourglass box of the display framebuffer
+grain_colour = None # Palette index of each grain
+
+# Grain parity is used in place of the original 'toggle' - even grains check left first, odd grains right first
+even_grains = None
+
+
+def start(grains_x, grains_y, no_grains):
+    global grid, owner, pos, width, background, even_grains, dirty, cell_tile, screen, grain_colour
+    # Build the occupancy grid from the hourglass graphic and load the grain positions
+
+    rgb = np.array(g.image.convert('RGB'))
+    height, width = rgb.shape[:2]
+    white = np.all(rgb == WHITE, axis=2)
+    green = np.all(rgb == GREEN, axis=2)
+
+    grid = np.full(height * width, WALL, dtype=np.uint8)
+    grid[white.ravel()] = EMPTY
+    grid[green.ravel()] = GRAIN
+
+    pos = (np.array(grains_y[:no_grains], dtype=np.int32) * width) + np.array(grains_x[:no_grains], dtype=np.int32)
+    owner = np.full(height * width, -1, dtype=np.int32)
+    owner[pos] = np.arange(no_grains, dtype=np.int32)
+
+    background = rgb.copy()
+    background[green] = WHITE
+
+    even_grains = (np.arange(no_grains) & 1) == 0
+
+    dirty = np.frombuffer(dirty_tiles.dirty, dtype=np.uint8)
+    cell_tile = np.array(dirty_tiles.cell_tile, dtype=np.int32)
+    screen = dirty_tiles.screen
+    grain_colour = dirty_tiles.grain_colour
+
+
+def move_grains(Direction):
+    # Moves all grains one pass in the gravity direction.  Same rules as the original engine, try moving each grain
+    # straight down first, if that fails then down left/right at 45 deg with the left/right order alternating by grain.
+    #
+    # All grains are checked at once, one move phase at a time (down, first diagonal, second diagonal), with each
+    # phase written to the grid before the next phase is checked.  A whole column of grains above a free cell falls
+    # together, as it does in the original engine where the lower grains are processed first.  Where two grains want
+    # the same diagonal cell the lowest grain index wins, again as it would have been processed first.
+    # Returns the number of grains moved in this pass
+
+    down_x, down_y, x_left, y_left, x_right, y_right = g.MOVE_OFFSETS[Direction]
+    if Direction == g.FLAT or pos.size == 0:
+        return 0 # Nothing to do....
+
+    # Convert the x/y offsets to linear grid offsets
+    down = down_y * width + down_x
+    left = y_left * width + x_left
+    right = y_right * width + x_right
+
+    # Straight down first
+    movers = falling(down)
+    update_count = movers.size
+    if movers.size:
+        move(movers, pos[movers] + down)
+
+    # Then the diagonals for the grains that could not move down, left or right first depending on the grain
+    moved = np.zeros(pos.size, dtype=bool)
+    moved[movers] = True
+    candidates = np.nonzero(~moved)[0]
+    for check_left in (True, False):
+        offset = np.where(even_grains[candidates] == check_left, left, right)
+        target = pos[candidates] + offset
+        free = grid[target] == EMPTY
+        movers = candidates[free]
+        if movers.size:
+            # Diagonal moves may compete for the same cell, lowest grain index wins
+            target, first_idx = np.unique(target[free], return_index=True)
+            movers = movers[first_idx]
+            move(movers, target)
+            update_count = update_count + movers.size
+            moved[movers] = True
+            candidates = candidates[~moved[candidates]]
+
+    return int(update_count)
+
+
+def falling(down):
+    # Returns the index of each grain that can move straight down.  A grain can move if the cell below is empty,
+    # or holds another grain that can itself move down, so start with the grains above an empty cell and work
+    # up each column one grain at a time.
+    below = pos + down
+    movers = np.nonzero(grid[below] == EMPTY)[0]
+    falling_grains = [movers]
+    while movers.size:
+        movers = owner[pos[movers] - down]
+        movers = movers[movers >= 0]
+        falling_grains.append(movers)
+
+    return np.concatenate(falling_grains)
+
+
+def move(movers, target):
+    # Move the selected grains to their target cells, clearing the old cells first so a falling column
+    # refills the cells it leaves behind
+    old = pos[movers]
+    grid[old] = EMPTY
+    owner[old] = -1
+    grid[target] = GRAIN
+    owner[target] = movers
+    pos[movers] = target
+    screen[old // width, old % width] = g.BACKGROUND_INDEX # Update the display framebuffer
+    screen[target // width, target % width] = grain_colour[movers]
+    dirty[cell_tile[old]] = 1 # Flag the display tiles for the next update
+    dirty[cell_tile[target]] = 1
+
+
+def render():
+    # Write the grid into the hourglass image
+    rgb = background.copy()
+    rgb.reshape(-1, 3)[grid == GRAIN] = GREEN
+    g.image.paste(Image.fromarray(rgb, 'RGB'))
+
+
+def finish(grains_x, grains_y):
+    # Save the grain positions back to the sorted grains arrays and bring the image up to date
+    np.frombuffer(grains_x, dtype=np.uint16)[:pos.size] = pos % width
+    np.frombuffer(grains_y, dtype=np.uint16)[:pos.size] = pos // width
+    render()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : grains_parallel.py
+# Description :	Multi-core grain engine - the hourglass occupancy grid is held in shared memory and split
+#               into horizontal strips, each pass is moved by worker processes one strip phase at a time.
+#               The even strips are moved together, then the odd strips (or the other way round), so
+#               neighbouring strips are never moved at the same time and no two workers write the same cells.
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+# Import application modules
+import my_globals as g
+import dirty_tiles
+
+# Occupancy grid cell values, otherwise the cell holds the index of the grain in it
+EMPTY = -1
+WALL = -2
+
+WHITE = (255, 255, 255) # Background colour
+GREEN = (0, 255, 0)     # Grain colour
+
+# Shared memory is three int32 arrays - the occupancy grid, the grain positions and the pass each grain was last moved
+shared = None   # SharedMemory block
+cells = None    # Flattened occupancy grid of the hourglass graphic (NumPy view of the shared memory)
+pos = None      # Linear grid position (y * width + x) of each grain, in sorted grain order
+previous = None # Grain positions at the end of the last pass, to find the grains that moved
+width = 0       # Width of the hourglass graphic
+background = None # RGB copy of the hourglass graphic with the grains removed, used for rendering
+pass_no = 0
+
+# Workers are always forked - hourglass.py runs its main loop at import, so a spawned worker re-importing it would
+# re-run the hardware setup and the menu loop.  Only the forking thread is copied, the display_worker and gyro_sampler
+# threads aren't, so the workers must only use the shared memory and their pipe (no display, gyro or locks)
+context = multiprocessing.get_context('fork')
+workers = []     # Worker processes and the connection to each
+connections = []
+
+dirty = None     # NumPy view of the dirty display tiles
+cell_tile = None # Dirty tile index of each grid cell
+screen = None    # Hourglass box of the display framebuffer
+
+
+def start(grains_x, grains_y, no_grains):
+    global shared, cells, pos, previous, width, background, pass_no, dirty, cell_tile, screen
+    # Build the occupancy grid in shared memory from the hourglass graphic, load the grain positions and start
+    # the workers (g.parallel_workers), each is given an even and an odd strip of the grid
+
+    rgb = np.array(g.image.convert('RGB'))
+    height, width = rgb.shape[:2]
+    white = np.all(rgb == WHITE, axis=2)
+    green = np.all(rgb == GREEN, axis=2)
+
+    no_cells = height * width
+    shared = shared_memory.SharedMemory(create=True, size=4 * (no_cells + 2 * no_grains + 1))
+    cells = np.ndarray(no_cells, dtype=np.int32, buffer=shared.buf)
+    pos = np.ndarray(no_grains, dtype=np.int32, buffer=shared.buf, offset=4 * no_cells)
+    stamp = np.ndarray(no_grains, dtype=np.int32, buffer=shared.buf, offset=4 * (no_cells + no_grains))
+
+    pos[:] = (np.array(grains_y[:no_grains], dtype=np.int32) * width) + np.array(grains_x[:no_grains], dtype=np.int32)
+    cells[:] = WALL
+    cells[white.ravel() | green.ravel()] = EMPTY
+    cells[pos] = np.arange(no_grains, dtype=np.int32)
+    stamp[:] = 0
+    del stamp
+    previous = pos.copy()
+    pass_no = 0
+
+    background = rgb.copy()
+    background[green] = WHITE
+
+    dirty = np.frombuffer(dirty_tiles.dirty, dtype=np.uint8)
+    cell_tile = np.array(dirty_tiles.cell_tile, dtype=np.int32)
+    screen = dirty_tiles.screen
+
+    # Strips must be at least 2 rows deep so grains in strips either side of an idle strip can't reach the same cells
+    no_workers = max(1, min(g.parallel_workers, height // 4))
+    bounds = [(height * i // (2 * no_workers)) * width for i in range(0, 2 * no_workers + 1)]
+    offsets = [(down_y * width + down_x, y_left * width + x_left, y_right * width + x_right)
+               for down_x, down_y, x_left, y_left, x_right, y_right in g.MOVE_OFFSETS]
+    for i in range(0, no_workers):
+        strips = ((bounds[2 * i], bounds[2 * i + 1]), (bounds[2 * i + 1], bounds[2 * i + 2]))
+        parent_end, worker_end = context.Pipe()
+        worker = context.Process(target=run_worker, name="grains_worker{}".format(i), daemon=True,
+                                  args=(shared.name, no_cells, no_grains, strips, offsets, worker_end))
+        worker.start()
+        worker_end.close()
+        workers.append(worker)
+        connections.append(parent_end)
+
+
+def run_worker(name, no_cells, no_grains, strips, offsets, connection):
+    # Worker process - moves the grains of one of its strips for each pass phase it is sent, replies with the
+    # number of grains moved.  Stops when sent None
+    block = shared_memory.SharedMemory(name=name)
+    grid = np.ndarray(no_cells, dtype=np.int32, buffer=block.buf)
+    buffer = block.buf.cast('i') # Indexing a memoryview is quicker than a NumPy array in the loop
+    try:
+        while True:
+            job = connection.recv()
+            if job is None:
+                break
+            current_pass, Direction, phase = job
+            first, last = strips[phase]
+            strip_grains = grid[first:last]
+            strip_grains = np.sort(strip_grains[strip_grains >= 0]).tolist()
+            connection.send(move_strip(buffer, no_cells, no_grains, strip_grains, offsets[Direction], current_pass))
+    finally:
+        del grid
+        buffer.release()
+        block.close()
+
+
+def move_strip(buffer, no_cells, no_grains, strip_grains, offsets, current_pass):
+    # Moves the grains of a strip in sorted grain order, same rules as the original engine - try moving each grain
+    # straight down first, if that fails then down left/right at 45 deg with the left/right order alternating by grain
+    # (even grains check left first, as the original 'toggle' does).  A grain is only moved once a pass, so a grain
+    # that crosses into the next strip isn't moved again in the next phase.
+    # Returns the number of grains moved
+    down, left, right = offsets
+    positions = no_cells          # Offsets of the arrays in the shared memory
+    stamps = no_cells + no_grains
+    update_count = 0
+
+    for i in strip_grains:
+        if buffer[stamps + i] == current_pass:
+            continue # Already moved in the other phase
+        buffer[stamps + i] = current_pass
+        cell = buffer[positions + i]
+
+        if buffer[cell + down] == EMPTY: # Check if next cell down is free
+            target = cell + down
+        elif i & 1 == 0:
+            if buffer[cell + left] == EMPTY: # Check left lower cell
+                target = cell + left
+            elif buffer[cell + right] == EMPTY: # Check right lower cell
+                target = cell + right
+            else:
+                continue
+        else:
+            if buffer[cell + right] == EMPTY: # Check right lower cell
+                target = cell + right
+            elif buffer[cell + left] == EMPTY: # Check left lower cell
+                target = cell + left
+            else:
+                continue
+
+        buffer[cell] = EMPTY
+        buffer[target] = i
+        buffer[positions + i] = target
+        update_count = update_count + 1
+
+    return update_count
+
+
+def move_grains(Direction):
+    global pass_no
+    # Moves all grains one pass in the gravity direction, one phase of strips (even or odd) then the other, with each
+    # worker moving its strip of the phase at the same time.  The sand runs through the neck in the centre of the
+    # hourglass, which is always a strip boundary, so the phase holding the strip below the neck (in the gravity
+    # direction) is moved first.  Grains falling through the neck then find the cells below already cleared, as they
+    # would in the original engine, rather than every other grain waiting a pass.
+    # The grains that moved are then written to the framebuffer.
+    # Returns the number of grains moved in this pass
+    if Direction == g.FLAT or pos.size == 0:
+        return 0 # Nothing to do....
+
+    pass_no = pass_no + 1
+    update_count = 0
+    centre = len(workers) # Strip below the centre of the grid, the one above is centre - 1
+    down_y = g.MOVE_OFFSETS[Direction][1]
+    first = centre & 1 if down_y > 0 else (centre - 1) & 1 if down_y < 0 else 0
+    phases = (first, 1 - first)
+    for phase in phases:
+        for connection in connections:
+            connection.send((pass_no, Direction, phase))
+        for connection in connections:
+            update_count = update_count + connection.recv()
+
+    if update_count:
+        movers = np.flatnonzero(pos != previous)
+        old = previous[movers]
+        target = pos[movers]
+        previous[movers] = target
+        screen[old // width, old % width] = g.BACKGROUND_INDEX # Update the display framebuffer, old cells first
+        screen[target // width, target % width] = dirty_tiles.grain_colour[movers] # as a grain may have moved into another's old cell
+        dirty[cell_tile[old]] = 1 # Flag the display tiles for the next update
+        dirty[cell_tile[target]] = 1
+
+    return update_count
+
+
+def render():
+    # Write the grains into the hourglass image
+    rgb = background.copy()
+    rgb.reshape(-1, 3)[pos] = GREEN
+    g.image.paste(Image.fromarray(rgb, 'RGB'))
+
+
+def finish(grains_x, grains_y):
+    global shared, cells, pos
+    # Save the grain positions back to the sorted grains arrays, bring the image up to date, then stop the workers
+    # and free the shared memory
+    np.frombuffer(grains_x, dtype=np.uint16)[:pos.size] = pos % width
+    np.frombuffer(grains_y, dtype=np.uint16)[:pos.size] = pos // width
+    render()
+
+    for connection in connections:
+        connection.send(None)
+    for worker in workers:
+        worker.join()
+    for connection in connections:
+        connection.close()
+    workers.clear()
+    connections.clear()
+
+    pos = pos.copy() # Keep the final positions (see grains.grain_cells()) once the shared memory is gone
+    cells = None
+    shared.close()
+    shared.unlink()
+    shared = None
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : gyro_sampler.py
+# Description :	Background thread that samples the accelerometer at a fixed rate, low pass filters the
+#               readings and publishes the gravity direction, so the grains loop never waits on I2C.
+#               The direction only changes when the filtered reading is clear of the direction thresholds
+#               (hysteresis) so a hourglass held near a threshold doesn't flip between neighbouring directions.
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import threading
+import time
+
+# Import application modules
+import my_globals as g
+from hourglassgyro import read_accel, gravity_direction
+
+# Current gravity direction.  Only written by the sampler thread, and a module variable holding an int is
+# replaced in one step, so the grains loop can read it at any time without a lock
+direction = g.FLAT
+
+idle = False      # Set while the grains have settled (quiescence.py), the sampler then reads at g.idle_poll_hz
+filtered = None   # Low pass filtered Ax, Ay, Az
+sampler = None    # Sampler thread, started by start()
+running = threading.Event() # Set while a continuous run needs the direction, the sampler waits on it otherwise
+
+
+def start():
+    global direction, filtered, sampler
+    # Take a first reading so the direction is valid straight away, then start (or resume) the sampler thread
+    if running.is_set():
+        return
+    filtered = list(read_accel())
+    direction = gravity_direction(*filtered)
+    running.set()
+    if sampler is None:
+        sampler = threading.Thread(target=run_sampler, name="gyro_sampler", daemon=True)
+        sampler.start()
+
+
+def stop():
+    # Pause the sampler at the end of a run so it makes no I2C reads outside continuous mode, see start()
+    running.clear()
+
+
+def run_sampler():
+    # Sampler thread - reads the accelerometer every 1/g.gyro_sample_hz seconds, or 1/g.idle_poll_hz when idle.
+    # Waits without reading while paused
+    next_sample = time.monotonic()
+    while True:
+        if not running.is_set():
+            running.wait()
+            next_sample = time.monotonic() # Start timing again from the resume
+        update(read_accel())
+
+        next_sample = next_sample + 1.0 / (g.idle_poll_hz if idle else g.gyro_sample_hz)
+        delay = next_sample - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_sample = time.monotonic() # Fallen behind, don't try to catch up
+
+
+def update(reading):
+    global direction
+    # Filter a new reading and update the direction if it has clearly changed
+    for i in range(0, 3):
+        filtered[i] = filtered[i] + g.gyro_filter * (reading[i] - filtered[i])
+
+    new_direction = gravity_direction(*filtered)
+    if new_direction != direction and clear_of_thresholds(new_direction):
+        direction = new_direction
+
+
+def clear_of_thresholds(new_direction):
+    # Returns True if every reading within g.gyro_hysteresis of the filtered reading gives the same direction.
+    # The thresholds are all on a single axis so checking the corners of the box around the reading is enough
+    h = g.gyro_hysteresis
+    Ax, Ay, Az = filtered
+    for dx in (-h, h):
+        for dy in (-h, h):
+            for dz in (-h, h):
+                if gravity_direction(Ax + dx, Ay + dy, Az + dz) != new_direction:
+                    return False
+    return True
@@ -15,25 +15,37 @@
 #                       Set - sets specified hourglass time - when Timer is pushed again will run at set rate 
 #                             - orientation is fixed again
 #                       Cal - runs through like the Timer to calibrate the times.  Should be able to more accurately set
-#                             the specified times.
+#                             the specified times.  Any timer run now does this, so Cal is only needed to pace the
+#                             very first timer run of a new graphic/fill.
 # Author      : Trevor Fillary
-# modification: 16-10-2021
+# modification: 17-10-2026
 ########################################################################
 
 import time
 from gpiozero import Button
 
-from colorsys import hsv_to_rgb
 from PIL import Image, ImageDraw, ImageFont
 from ST7789 import ST7789
 
 # Import application modules
 import my_globals as g
 from hourglassgyro import gyro_init, read_gyro_xy
-from grains import analyse_hourglass_graphic, fill_hourglass, update_grains
+from grains import position_hourglass, analyse_hourglass_graphic, fill_hourglass, update_grains
+import grains_cache
+import pacing
+import timer_replay
+import pass_profiler
+import frame_rate
 
 # Image variables
-draw = None
+HOURGLASS_GRAPHIC = "hourglassOnly.bmp"
+FONT_FILE = '/usr/share/fonts/truetype/freefont/FreeSans.ttf'
+font = None   # Fonts are loaded on first use
+font2 = None
+
+# Pre-rendered screens as 16-bit 565 RGB data ready to send to the display, rendered on first use
+screen_data = {}
+STATS_Y = 100  # Completed screen stats are drawn from here down, the rest of the screen is static
 
 # Stat variables
 total_move_count = 0
@@ -43,133 +55,176 @@ g.mode = g.MENU  # default to menu at start
 
 # Used to set the reqired timing period
 set_time = 3 # Default to 3 minutes
-cal_time = 0
-
-def draw_menu():
-    global draw
-    g.image = Image.open("hourglassOnly.bmp") # Load initial picture
-    hg_width, hg_height = g.image.size
-
-    menuimage = Image.new('RGB', (240,240), color = (255,255,255)) # Create a white screen
+timer_set = False # Timer runs as fast as possible until a time has been set (or a cal run)
+
+def load_fonts():
+    global font, font2
+    # Create our fonts, passing in the font file and font size
+    if font is None:
+        font = ImageFont.truetype(FONT_FILE, 16)
+        font2 = ImageFont.truetype(FONT_FILE, 24)
+
+def screen(name, render):
+    # Returns the pre-rendered screen data, rendering and converting the screen image on first use
+    if name not in screen_data:
+        load_fonts()
+        screen_data[name] = g.st7789.image_to_bytes(render())
+    return screen_data[name]
+
+def render_menu():
+    menuimage = Image.new('RGB', (g.SCREEN_SIZE,g.SCREEN_SIZE), color = (255,255,255)) # Create a white screen
     draw = ImageDraw.Draw(menuimage) # Setup so can draw on the screen for menu etc.
     
     # Now to add some text for the buttons.....
-    font = ImageFont.truetype('/usr/share/fonts/truetype/freefont/FreeSans.ttf', 16) # Create our font, passing in the font file and font size
-    #font2 = ImageFont.truetype('/usr/share/fonts/truetype/freefont/FreeSans.ttf', 24) # Create our font, passing in the font file and font size
-
     txt_colour = (0,0,0)
-    draw.text((5, 60), "Time", font = font, fill = txt_colour) # A button
-    draw.text((5, 180), "Set", font = font, fill = txt_colour) # B button    
-    draw.text((157, 60), "Continuous", font = font, fill = txt_colour) # X button
-    draw.text((170, 180), "Cal", font = font, fill = txt_colour) # Y button
+    top_row = int(g.SCREEN_SIZE/4)        # Button text next to the buttons at the side of the screen
+    bottom_row = int(g.SCREEN_SIZE*3/4)
+    draw.text((5, top_row), "Time", font = font, fill = txt_colour) # A button
+    draw.text((5, bottom_row), "Set", font = font, fill = txt_colour) # B button    
+    draw.text((g.SCREEN_SIZE - 83, top_row), "Continuous", font = font, fill = txt_colour) # X button
+    draw.text((g.SCREEN_SIZE - 70, bottom_row), "Cal", font = font, fill = txt_colour) # Y button
+    return menuimage
+
+def draw_menu():
+    g.image = Image.open(HOURGLASS_GRAPHIC) # Load initial picture
 
     # draw menu items
-    g.st7789.display(menuimage)
+    g.st7789.display_data(screen('menu', render_menu))
 
-    # Calculate position of hourglass graphic (centre of the screen)
-    mid_screen = int(g.SCREEN_SIZE/2)
-    mid_hourglass_x = int(hg_width/2)
-    mid_hourglass_y = int(hg_height/2)
-    g.hg_tl_x = mid_screen - mid_hourglass_x
-    g.hg_tl_y = mid_screen - mid_hourglass_y
-    g.hg_br_x = mid_screen + mid_hourglass_x
-    g.hg_br_y = mid_screen + mid_hourglass_y
+    position_hourglass() # Centre of the screen
 
     g.st7789.display(g.image, g.hg_tl_x,g.hg_tl_y,g.hg_br_x,g.hg_br_y)  # add hourglass image
 
 
-def draw_set():
-    # Draw set image screen
-    set_image = Image.new('RGB', (240,240), color = (255,255,255)) # Create a white screen
+def render_set():
+    set_image = Image.new('RGB', (g.SCREEN_SIZE,g.SCREEN_SIZE), color = (255,255,255)) # Create a white screen
     draw = ImageDraw.Draw(set_image) # Setup so can draw on the screen for menu etc.
     
     # Now to add some text for the buttons.....
-    font = ImageFont.truetype('/usr/share/fonts/truetype/freefont/FreeSans.ttf', 16) # Create our font, passing in the font file and font size
-    #font2 = ImageFont.truetype('/usr/share/fonts/truetype/freefont/FreeSans.ttf', 24) # Create our font, passing in the font file and font size
-
     txt_colour = (0,0,0)
-    draw.text((5, 60), "1.5 Minutes", font = font, fill = txt_colour) # A button
-    draw.text((5, 180), "6 Minutes", font = font, fill = txt_colour) # B button    
-    draw.text((156, 60), "3 Minutes", font = font, fill = txt_colour) # X button
-    draw.text((156, 180), "10 Minutes", font = font, fill = txt_colour) # Y button
+    top_row = int(g.SCREEN_SIZE/4)        # Button text next to the buttons at the side of the screen
+    bottom_row = int(g.SCREEN_SIZE*3/4)
+    draw.text((5, top_row), "1.5 Minutes", font = font, fill = txt_colour) # A button
+    draw.text((5, bottom_row), "6 Minutes", font = font, fill = txt_colour) # B button    
+    draw.text((g.SCREEN_SIZE - 84, top_row), "3 Minutes", font = font, fill = txt_colour) # X button
+    draw.text((g.SCREEN_SIZE - 84, bottom_row), "10 Minutes", font = font, fill = txt_colour) # Y button
+    return set_image
 
-    # draw Set screen
-    g.st7789.display(set_image)
+def draw_set():
+    # Draw set image screen
+    g.st7789.display_data(screen('set', render_set))
+
+def render_completed():
+    # Static part of the completed screen, the stats are added by draw_completed()
+    completed_image = Image.new('RGB', (g.SCREEN_SIZE,g.SCREEN_SIZE), color = (255,255,255)) # Create a white screen
+    draw = ImageDraw.Draw(completed_image) # Setup so can draw on the screen for menu etc.
+    draw.text((40, 50), "TIME'S UP", font = font2, fill = ("red"))
+    return completed_image
 
 def draw_completed():
     # Draw completed image screen
-    completed_image = Image.new('RGB', (240,240), color = (255,255,255)) # Create a white screen
-    draw = ImageDraw.Draw(completed_image) # Setup so can draw on the screen for menu etc.
-    
-    # Now to add some text 
-    font = ImageFont.truetype('/usr/share/fonts/truetype/freefont/FreeSans.ttf', 16) # Create our font, passing in the font file and font size
-    font2 = ImageFont.truetype('/usr/share/fonts/truetype/freefont/FreeSans.ttf', 24) # Create our font, passing in the font file and font size
+    static_data = screen('completed', render_completed)
 
-    draw.text((40, 50), "TIME'S UP", font = font2, fill = ("red"))
+    # Only the stats part of the screen is drawn for each run
+    stats_image = Image.new('RGB', (g.SCREEN_SIZE,g.SCREEN_SIZE - STATS_Y), color = (255,255,255))
+    draw = ImageDraw.Draw(stats_image)
 
     txt = "No. Passes: {}".format(pass_count)
-    draw.text((20, 100), txt, font = font, fill = ("black"))
-
-    txt = "No Moves: {}".format(total_move_count)
-    draw.text((20, 140), txt, font = font, fill = ("black"))
+    draw.text((20, 100 - STATS_Y), txt, font = font, fill = ("black"))
 
-    txt = "Time Taken: \n{:.2f}, seconds".format(duration)
-    draw.text((20, 180), txt, font = font, fill = ("black"))
+    txt = "Display FPS: {:.1f}".format(frame_rate.achieved_fps())
+    draw.text((20, 120 - STATS_Y), txt, font = font, fill = ("black"))
 
-    # draw completed screen
-    g.st7789.display(completed_image)
+    txt = "No Moves: {}".format(total_move_count)
+    draw.text((20, 140 - STATS_Y), txt, font = font, fill = ("black"))
+
+    if g.profile_passes != 0 and pass_profiler.count != 0:
+        txt = "Pass ms: {:.1f}/{:.1f}/{:.1f}".format(*[t * 1000 for t in pass_profiler.percentiles()]) # p50/p95/max
+        draw.text((20, 160 - STATS_Y), txt, font = font, fill = ("black"))
+
+    if pacing.final_error is None:
+        txt = "Time Taken: \n{:.2f}, seconds".format(duration)
+    else:
+        txt = "Time Taken: {:.2f}s\nTimer error: {:+.2f}s".format(duration, pacing.final_error)
+    draw.text((20, 180 - STATS_Y), txt, font = font, fill = ("black"))
+
+    # draw completed screen, stats replace the bottom of the static screen data so it is still a single write
+    stats_offset = STATS_Y * g.SCREEN_SIZE * 2 # 2 bytes per pixel
+    g.st7789.display_data(static_data[:stats_offset] + g.st7789.image_to_bytes(stats_image))
+
+def set_mode(mode):
+    # Change mode from a button press and wake up the main loop
+    with g.mode_changed:
+        g.mode = mode
+        g.mode_changed.notify_all()
+
+def next_mode(current, mode):
+    # Move the main loop on from the current mode, unless a button press has already changed it
+    with g.mode_changed:
+        if g.mode == current:
+            g.mode = mode
+
+def wait_for_button():
+    # Block until a button press changes the mode, so no CPU is used waiting
+    with g.mode_changed:
+        while g.mode == g.DO_NOTHING or g.mode == g.WAIT or g.mode == g.SET:
+            g.mode_changed.wait()
 
 def btn1handler():
-    global set_time
+    global set_time, timer_set
     # If TIMING or FINISHED, any button press will go back to the menu
     if g.mode == g.TIMING or g.mode == g.FINISHED:
-        g.mode = g.MENU
+        set_mode(g.MENU)
     elif g.mode == g.SET:
         set_time = 1.5 # Minutes
-        g.mode = g.MENU
+        timer_set = True
+        set_mode(g.MENU)
     elif g.mode == g.WAIT:
-        g.mode = g.MENU        
+        set_mode(g.MENU)        
     else: # Menu option for button A is to start timer
-        g.mode = g.TIMING
+        set_mode(g.TIMING)
 
 def btn2handler():
-    global set_time
+    global set_time, timer_set
     # If TIMING or FINISHED, any button press will go back to the menu
     if g.mode == g.TIMING or g.mode == g.FINISHED:
-        g.mode = g.MENU
+        set_mode(g.MENU)
     elif g.mode == g.SET:
         set_time = 6 # Minutes
-        g.mode = g.MENU
+        timer_set = True
+        set_mode(g.MENU)
     elif g.mode == g.WAIT:
-        g.mode = g.MENU           
+        set_mode(g.MENU)           
     else: # Menu option for button B is to set timer duration
-        g.mode = g.SET_MENU
+        set_mode(g.SET_MENU)
 
 def btn3handler():
-    global set_time
+    global set_time, timer_set
     # If TIMING or FINISHED, any button press will go back to the menu
     if g.mode == g.TIMING or g.mode == g.FINISHED:
-        g.mode = g.MENU
+        set_mode(g.MENU)
     elif g.mode == g.SET:
         set_time = 3 # Minutes
-        g.mode = g.MENU
+        timer_set = True
+        set_mode(g.MENU)
     elif g.mode == g.WAIT:
-        g.mode = g.MENU   
+        set_mode(g.MENU)   
     else: # Menu option for button X is to run hourglass continuously
-        g.mode = g.CONTINUOUS
+        set_mode(g.CONTINUOUS)
 
 def btn4handler():
-    global set_time
+    global set_time, timer_set
     # If TIMING or FINISHED, any button press will go back to the menu
     if g.mode == g.TIMING or g.mode == g.FINISHED:
-        g.mode = g.MENU
+        set_mode(g.MENU)
     elif g.mode == g.SET:
         set_time = 10 # Minutes
-        g.mode = g.MENU
+        timer_set = True
+        set_mode(g.MENU)
     elif g.mode == g.WAIT:
-        g.mode = g.MENU           
+        set_mode(g.MENU)           
     else: # Menu option for button Y is to run the calibration
-        g.mode = g.CAL
+        set_mode(g.CAL)
 
 # Setup gyro object
 gyro_init()
@@ -178,6 +233,8 @@ gyro_init()
 SPI_SPEED_MHZ = 80
 # Save object in global for other modules to use
 g.st7789 = ST7789(
+    width=g.SCREEN_SIZE,
+    height=g.SCREEN_SIZE,
     rotation=90,  # Needed to display the right way up on Pirate Audio
     port=0,       # SPI port
     cs=1,         # SPI port Chip-select channel
@@ -201,10 +258,10 @@ btn4.when_pressed = btn4handler
 while True:
     if g.mode == g.TIMING:
         game_start = time.time()
-        if g.pass_delay != 0:  # Only update if has been through a calibration
-            g.pass_delay = (set_time*60/pass_count) - (cal_time/pass_count)
+        g.timer_seconds = set_time*60 if timer_set else 0 # Paced once the number of passes is known
         total_move_count, pass_count = update_grains()
-        g.mode = g.FINISHED
+        grains_cache.save_passes(HOURGLASS_GRAPHIC, g.timing_passes)
+        next_mode(g.TIMING, g.FINISHED)
 
     # Run continuously to allow playing with hourglass
     elif g.mode == g.CONTINUOUS:
@@ -214,30 +271,34 @@ while True:
     # Display the timer set options
     elif g.mode == g.SET_MENU:
         draw_set()
-        g.mode = g.SET # Set mode for buttion selection
+        next_mode(g.SET_MENU, g.SET) # Set mode for buttion selection
         
     elif g.mode == g.CAL:
-        cal_start = time.time()
+        # Runs through like the timer to find the number of passes, timer runs are then paced to the set time
         total_move_count, pass_count = update_grains()
-        cal_time = time.time() - cal_start
-        g.pass_delay = (set_time*60/pass_count) - (cal_time/pass_count)
-        #print(cal_time,pass_delay,pass_count, total_move_count)
+        grains_cache.save_passes(HOURGLASS_GRAPHIC, g.timing_passes)
+        timer_set = True
+        #print(pass_count, total_move_count)
         g.mode = g.MENU # Set mode for buttion selection
 
     # Draw initial screen and menu
     elif g.mode == g.MENU:
         g.no_grains = 0 # ready to start again
         draw_menu() # Load hourglass graphic and add menu options
-        analyse_hourglass_graphic() # Set up useful constants based on graphic size/position
-        fill_hourglass() # Fill top of hourglass
-        g.mode = g.DO_NOTHING  # Dont do anything until a button is pressed.
+        if not grains_cache.load(HOURGLASS_GRAPHIC): # Use the filled hourglass from last time if the graphic is unchanged
+            analyse_hourglass_graphic() # Set up useful constants based on graphic size/position
+            fill_hourglass() # Fill top of hourglass
+            grains_cache.save(HOURGLASS_GRAPHIC)
+        g.timing_passes = grains_cache.load_passes(HOURGLASS_GRAPHIC) # Known from an earlier timer run of this fill
+        if g.replay_timer and not timer_replay.load(HOURGLASS_GRAPHIC):
+            timer_replay.record(HOURGLASS_GRAPHIC) # Simulate the timer run once, then timer runs are replayed
+        next_mode(g.MENU, g.DO_NOTHING)  # Dont do anything until a button is pressed.
 
     if g.mode == g.FINISHED:
         game_end = time.time()
         duration = game_end - game_start
         draw_completed()
         #print(duration)
-        g.mode = g.WAIT
-
+        next_mode(g.FINISHED, g.WAIT)
 
-    #time.sleep(0.05)
\ No newline at end of file
+    wait_for_button() # Sleeps until a button press if there is nothing to do
\ No newline at end of file
@@ -3,9 +3,10 @@
 # Filename    : hourglassgyro.py
 # Description :	Module to read the gyro sensor for the hourglass application and return compass directions
 # Author      : Trevor Fillary
-# modification: 29-08-2021
+# modification: 17-10-2026 - accelerometer/gyro registers read in a single I2C block transfer
 ########################################################################
 
+import struct
 import smbus			#import SMBus module of I2C
 
 # Import application modules
@@ -25,6 +26,10 @@ GYRO_XOUT_H  = 0x43
 GYRO_YOUT_H  = 0x45
 GYRO_ZOUT_H  = 0x47
 
+# Registers from ACCEL_XOUT_H are read as one block - accel x/y/z, temperature, gyro x/y/z, each high byte first
+ACCEL_BLOCK_LENGTH = 6
+ALL_BLOCK_LENGTH = 14
+
 # Create / init gyro object
 bus = 0
 Device_Address = 0
@@ -62,21 +67,19 @@ def read_raw_data(addr):
     value = ((high << 8) | low)
     
     #to get signed value from mpu6050
-    if(value > 32768):
+    if(value >= 32768):
         value = value - 65536
     return value
 
+def read_block(addr, length):
+    # Read a block of 16-bit registers in one I2C transfer, returns a tuple of the signed values
+    block = bus.read_i2c_block_data(Device_Address, addr, length)
+    return struct.unpack('>%dh' % (length // 2), bytes(block))
+
 # NOTE: Useful general routine NOT used in this application
 def read_gyro_data():
-    #Read Accelerometer raw value
-    acc_x = read_raw_data(ACCEL_XOUT_H)
-    acc_y = read_raw_data(ACCEL_YOUT_H)
-    acc_z = read_raw_data(ACCEL_ZOUT_H)
-
-    #Read Gyroscope raw value
-    gyro_x = read_raw_data(GYRO_XOUT_H)
-    gyro_y = read_raw_data(GYRO_YOUT_H)
-    gyro_z = read_raw_data(GYRO_ZOUT_H)
+    #Read Accelerometer, temperature and Gyroscope raw values
+    acc_x, acc_y, acc_z, temp, gyro_x, gyro_y, gyro_z = read_block(ACCEL_XOUT_H, ALL_BLOCK_LENGTH)
 
     #Full scale range +/- 250 degree/C as per sensitivity scale factor
     Ax = acc_x/16384.0
@@ -93,17 +96,23 @@ def read_gyro_xy():
     # Cut down routine to just read the x and y accelerometer values used.  
     # Ax and Ay are used to determine the orientation of the hourglass gravity, either N/S/E/W/NE/NW/SE/SW
     # Return gravity direction
+    Ax, Ay, Az = read_accel()
+    return gravity_direction(int(Ax), int(Ay), int(Az))
+
+def read_accel():
+    # Read the accelerometer, returns Ax, Ay, Az as a percentage of 1g in the hourglass orientation
     
-    # Read Accelerometer raw value
-    acc_x = read_raw_data(ACCEL_XOUT_H)
-    acc_y = read_raw_data(ACCEL_YOUT_H)
-    acc_z = read_raw_data(ACCEL_ZOUT_H)
+    # Read Accelerometer raw values
+    acc_x, acc_y, acc_z = read_block(ACCEL_XOUT_H, ACCEL_BLOCK_LENGTH)
 
-    Ay = int(acc_x/163.84)      # x & y swaped due to sensor orientationin the Pi Zero case
-    Ax = int(acc_y/163.84)
-    Az = int(acc_z/163.84)
+    Ay = acc_x/163.84      # x & y swaped due to sensor orientationin the Pi Zero case
+    Ax = acc_y/163.84
+    Az = acc_z/163.84
+    return Ax, Ay, Az
 
+def gravity_direction(Ax, Ay, Az):
     # Ax and Ay are used to determine the orientation of the hourglass, either N/S/E/W/NE/NW/SE/SW
+    # Return gravity direction
     #print(Ax,Ay,Az)
 
     # Establish gravity direction
@@ -3,8 +3,9 @@
 # Filename    : my_globals.py
 # Description :	Globals for hourglass application
 # Author      : Trevor Fillary
-# modification: 29-09-2021
+# modification: 17-10-2026
 ########################################################################
+import threading
 
 # Gravity definitions - For the normal way up gravity is South
 FLAT = 0
@@ -17,7 +18,24 @@ NW = 6
 SE = 7
 SW = 8
 
+# Grain move offsets for each gravity direction, indexed by the direction above.
+# Each entry is (down_x, down_y, x_left, y_left, x_right, y_right) and all pairs are added to the 'grain'
+# position.  Down x/y is the initial test to see if the grain can move directly 'below', x/y left & right
+# are used to check whether it can move 45 degrees left or right instead.
+MOVE_OFFSETS = [
+    (0, 0, 0, 0, 0, 0),     # FLAT - Nothing to do....
+    (0, -1, 1, -1, -1, -1), # N - Upside down, -ve down
+    (0, 1, -1, 1, 1, 1),    # S - Right way up, +ve down
+    (1, 0, 1, 1, 1, -1),    # E
+    (-1, 0, -1, -1, -1, 1), # W
+    (1, -1, 2, 0, 0, -2),   # NE - 45 deg tilt, left is effectively up left 45 deg
+    (-1, -1, 0, -2, -2, 0), # NW - 45 deg tilt, right is effectively up right 45 deg
+    (1, 1, 0, 2, 2, 0),     # SE - 45 deg tilt, right is effectively up right 45 deg
+    (-1, 1, -2, 0, 0, 2),   # SW - 45 deg tilt, left is effectively up left 45 deg
+]
+
 mode = 0
+mode_changed = threading.Condition() # Guards mode changes, notified when a button press changes the mode
 # Global 'mode' state variables
 TIMING = 1
 MENU = 2 
@@ -29,7 +47,12 @@ CAL = 7
 WAIT = 8
 DO_NOTHING = 99
 
-SCREEN_SIZE = 240 # 240x240 square
+SCREEN_SIZE = 240 # 240x240 square, change for a bigger panel
+
+# The hourglass part of the display framebuffer holds palette indexes (palette.py), each grain has its own index
+BACKGROUND_INDEX = 0 # white
+sand_colours = 'green' # Sand colour scheme - 'green' (original), 'layers' (rainbow by fill layer) or 'sand'
+
 hg_tl_x = 0 # HourGlass Top Left
 hg_tl_y = 0
 hg_br_x = 0 # HourGlass bottom right
@@ -39,4 +62,35 @@ st7789 = None  # Display object
 image = None   # Image object
 
 no_grains = 0  # Keeps track of the number of grains created in the hourglass
-pass_delay = 0 # Used to delay the passes to match the required delay - needs to be calibrated before use - 0 means don't use!!
\ No newline at end of file
+max_grains = 0 # Grain capacity, 0 to size it from the hourglass graphic
+fill_grains = 0 # Number of grains to fill the hourglass with, 0 to fill a set number of rows (NO_GRAIN_ROWS in grains.py)
+timer_seconds = 0 # Required duration of a timer run, 0 to run as fast as possible
+timing_passes = 0 # Number of passes a timer run takes for the current fill, 0 if not known yet.  Learnt from each timer/cal run
+
+# Grain engine selection - set at startup
+PIXEL_ENGINE = 0 # Original per grain engine using the PIL pixel graphic for collision checks
+NUMPY_ENGINE = 1 # Whole pass vectorised engine using a NumPy occupancy grid
+ACTIVE_ENGINE = 2 # Original engine rules but only checks grains that could move (active set)
+FLAT_ENGINE = 3 # Original engine loop using a flat bytearray occupancy grid and linear move offsets
+PARALLEL_ENGINE = 4 # Original engine rules run by worker processes on strips of a shared memory occupancy grid
+MARGOLUS_ENGINE = 5 # 2x2 block cellular automaton, every block updated at once from lookup tables
+engine = PIXEL_ENGINE
+parallel_workers = 4 # Number of worker processes for the parallel engine, one per core is best
+
+# Gyro sampling - the gravity direction is read by a background thread (gyro_sampler.py)
+gyro_sample_hz = 100 # Accelerometer reads per second, 0 to read it at the start of every pass instead
+gyro_filter = 0.25 # Low pass filter factor for each new reading, 1 for no filtering
+gyro_hysteresis = 5 # Filtered reading must be this far past a direction threshold (percent of 1g) to change direction
+
+idle_poll_hz = 10 # Orientation reads per second once the grains have settled in continuous mode, 0 to keep running every pass
+idle_cycle_passes = 8 # Longest cycle of grain positions (passes) treated as settled, 0 to only settle when nothing moves
+
+replay_timer = True # Timer runs replay a recording of the run, made once for each fill (timer_replay.py)
+
+record_dir = None # Directory to record the grain moves of every pass of each run to (pass_recorder.py), None for no recording
+
+profile_passes = 0 # Number of passes to keep timings for in the pass profiler (pass_profiler.py), 0 to turn it off
+profile_export = None # CSV (or .json) file to export the pass profile to after each run, None for no export
+
+display_fps = 30 # Maximum display updates (frames) per second while the grains move, 0 to update after every pass
+async_display = True # Send the grain display updates from a background thread (display_worker.py) while the grains move
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : pacing.py
+# Description :	Paces a timer run so the grains finish at the set time.  Each pass is given a deadline
+#               on the monotonic clock, spread evenly over the set time using the number of passes a timer
+#               run takes, so time lost to a slow pass (display, I2C) is made up on the following passes
+#               rather than adding up as drift.
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import time
+
+# Import application modules
+import my_globals as g
+
+start_time = 0
+target_seconds = 0    # Required run time
+expected_passes = 0   # Passes a timer run takes, from a previous run
+final_error = None    # Seconds the last paced run finished late (+) or early (-), None if it wasn't paced
+
+
+def start(seconds, passes):
+    global start_time, target_seconds, expected_passes, final_error
+    # Start pacing a run of 'passes' passes to take 'seconds'
+    target_seconds = seconds
+    expected_passes = passes
+    final_error = None
+    start_time = time.monotonic()
+
+
+def wait(pass_count):
+    # Wait for the deadline of the given (completed) pass, returns early if a button press ends the timer run.
+    # If the run takes more passes than expected the extra passes have no deadline left to wait for, so run as fast
+    # as possible
+    if pass_count > expected_passes:
+        return
+    delay = start_time + target_seconds * pass_count / expected_passes - time.monotonic()
+    if delay > 0:
+        with g.mode_changed:
+            g.mode_changed.wait_for(lambda: g.mode != g.TIMING, delay)
+
+
+def finish():
+    global final_error
+    # End of the paced run, records the error against the required run time
+    final_error = time.monotonic() - start_time - target_seconds
+    return final_error
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : palette.py
+# Description :	Colour palette of the hourglass display framebuffer (dirty_tiles.screen), which holds a
+#               one byte palette index per pixel.  The palette is a 256 entry lookup table of 16-bit 565 RGB
+#               colours so a display update is a single table lookup, and changing the sand colours is just
+#               a change to the table.  Each grain has its own index, set from its position in the fill.
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+from colorsys import hsv_to_rgb
+
+import numpy as np
+from ST7789 import ST7789
+
+# Import application modules
+import my_globals as g
+
+# Palette layout
+BACKGROUND = 0          # White background, same as g.BACKGROUND_INDEX
+FIRST_GRAPHIC = 1       # Colours of the hourglass graphic (outline etc), allocated as they are found
+LAST_GRAPHIC = 15
+FIRST_GRAIN = 16        # Sand colours, grains are spread evenly over these by fill position
+GRAIN_COLOURS = 256 - FIRST_GRAIN
+
+WHITE = (255, 255, 255)
+GREEN = (0, 255, 0)     # Grain colour in the hourglass image
+
+colours = np.zeros(256, dtype='>u2') # Palette, index to 16-bit 565 RGB (big endian, as sent to the display)
+colours[BACKGROUND] = ST7789.color565(*WHITE)
+graphic_colours = {}    # Index of each hourglass graphic colour allocated
+
+
+def set_scheme(scheme):
+    # Set the sand colours - 'green' (all grains green, as the original), 'layers' (a rainbow from the first grains
+    # filled at the centre of the hourglass to the last at the top) or 'sand' (shades of sand by fill layer)
+    position = np.arange(GRAIN_COLOURS) / (GRAIN_COLOURS - 1)
+    if scheme == 'green':
+        rgb = [GREEN] * GRAIN_COLOURS
+    elif scheme == 'layers':
+        rgb = [hsv_to_rgb(0.8 * p, 1.0, 1.0) for p in position]
+    elif scheme == 'sand':
+        rgb = [hsv_to_rgb(0.08 + 0.05 * p, 0.75 - 0.35 * p, 0.65 + 0.35 * p) for p in position]
+    else:
+        raise ValueError("Unknown sand colour scheme: {}".format(scheme))
+    if scheme != 'green':
+        rgb = [(int(r * 255), int(gr * 255), int(b * 255)) for r, gr, b in rgb]
+    colours[FIRST_GRAIN:] = [ST7789.color565(*colour) for colour in rgb]
+
+
+def grain_colours(no_grains):
+    # Returns the palette index of each grain in sorted grain order.  The sorted grains are in fill order (rows from
+    # the centre of the hourglass up) so spreading them over the sand colours colours the grains by fill layer
+    return (FIRST_GRAIN + (np.arange(no_grains) * GRAIN_COLOURS) // max(no_grains, 1)).astype(np.uint8)
+
+
+def image_indexes(rgb):
+    # Returns the palette index of each pixel of an RGB image array (height, width, 3), grains (green) are returned
+    # as background for the caller to colour.  New colours are given the next free graphic index, once those run out
+    # the nearest graphic colour is used
+    flat = rgb.reshape(-1, 3)
+    values, inverse = np.unique(flat[:, 0].astype(np.uint32) << 16 | flat[:, 1].astype(np.uint32) << 8 | flat[:, 2],
+                                return_inverse=True)
+    indexes = np.zeros(values.size, dtype=np.uint8)
+    for i, value in enumerate(values.tolist()):
+        colour = (value >> 16, (value >> 8) & 0xFF, value & 0xFF)
+        if colour == WHITE or colour == GREEN:
+            indexes[i] = BACKGROUND
+        else:
+            indexes[i] = graphic_index(colour)
+    return indexes[inverse.reshape(-1)].reshape(rgb.shape[:2])
+
+
+def graphic_index(colour):
+    # Returns the palette index of a graphic colour, allocating one if needed
+    if colour in graphic_colours:
+        return graphic_colours[colour]
+    if len(graphic_colours) <= LAST_GRAPHIC - FIRST_GRAPHIC:
+        index = FIRST_GRAPHIC + len(graphic_colours)
+        colours[index] = ST7789.color565(*colour)
+        graphic_colours[colour] = index
+        return index
+    return min(graphic_colours.items(), key=lambda item: sum((a - b) ** 2 for a, b in zip(item[0], colour)))[1]
+
+
+set_scheme(g.sand_colours)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : pass_profiler.py
+# Description :	Optional per pass profiler for update_grains().  Times each phase of a pass (gyro read,
+#               grain moves, display update, pacing sleep) into a preallocated ring buffer holding the
+#               most recent passes, gives percentiles of the pass time and exports the data to CSV/JSON.
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import csv
+import json
+
+import numpy as np
+
+PHASES = ('gyro', 'grains', 'display', 'sleep')
+
+phase_times = None  # Ring buffer of the phase times of each pass, in seconds
+pass_moves = None   # Ring buffer of the grains moved in each pass
+count = 0           # Passes recorded in this run, the ring buffer holds the last len(pass_moves) of them
+
+
+def start(size):
+    global phase_times, pass_moves, count
+    # Start profiling a run, keeping the last 'size' passes
+    if pass_moves is None or len(pass_moves) != size:
+        phase_times = np.zeros((size, len(PHASES)))
+        pass_moves = np.zeros(size, dtype=np.int32)
+    count = 0
+
+
+def record(t0, t1, t2, t3, t4, moves):
+    global count
+    # Record a pass from the times at the start of each phase and the end of the pass
+    i = count % len(pass_moves)
+    phase_times[i] = (t1 - t0, t2 - t1, t3 - t2, t4 - t3)
+    pass_moves[i] = moves
+    count = count + 1
+
+
+def samples():
+    # Returns the first pass number held, and the phase times and moves of the passes held in pass order
+    held = min(count, len(pass_moves))
+    order = np.arange(count - held, count) % len(pass_moves)
+    return count - held + 1, phase_times[order], pass_moves[order]
+
+
+def percentiles():
+    # Returns the p50, p95 and max pass time in seconds, None if nothing has been recorded
+    if count == 0:
+        return None
+    _, times, _ = samples()
+    pass_times = times.sum(axis=1)
+    return np.percentile(pass_times, 50), np.percentile(pass_times, 95), pass_times.max()
+
+
+def export(filename):
+    # Export the passes held to a CSV file, or a JSON file if the name ends in .json.  Times are in milliseconds
+    first_pass, times, moves = samples()
+    times = times * 1000
+    if filename.endswith('.json'):
+        with open(filename, 'w') as f:
+            json.dump({'first_pass': first_pass, 'phases': PHASES, 'moves': moves.tolist(),
+                       'times_ms': times.round(4).tolist()}, f)
+        return
+
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('pass', 'moves') + tuple(phase + '_ms' for phase in PHASES))
+        for i in range(0, len(moves)):
+            writer.writerow([first_pass + i, moves[i]] + ["{:.4f}".format(t) for t in times[i]])
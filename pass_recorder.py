@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : pass_recorder.py
+# Description :	Records the grain moves of every pass of a run to a compact binary file, for replay,
+#               debugging and offline analysis.  The files are memory mapped and grown a chunk at a time
+#               so a long continuous run doesn't build up Python objects or use more and more RAM.
+#               PassReader reads a recording back, any pass can be found directly from the index file.
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import mmap
+import struct
+
+import numpy as np
+
+# File format (all little endian), version 1
+#   Moves file - HEADER then the start cell (y * width + x of the hourglass graphic) of each grain in sorted
+#                grain order, then a (grain, old cell, new cell) record for each grain move of each pass.
+#                Cells and grain indexes are 16 bit if they fit, otherwise 32 bit (header item_size).
+#   Index file - INDEX_HEADER then an INDEX_ENTRY for each pass, giving the first move record of the pass,
+#                the number of moves and the gravity direction.
+# The pass and move counts in the headers are updated after every pass so a recording cut short (eg power cut)
+# can still be read up to the last complete pass.
+MAGIC = b'HGMOVES\x00'
+INDEX_MAGIC = b'HGINDEX\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sHHIHHQQ')  # magic, version, item_size, no_grains, width, height, passes, moves
+INDEX_HEADER = struct.Struct('<8sHHIQ') # magic, version, entry size, (unused), passes
+HEADER_SIZE = 64                        # Headers are padded to this size
+INDEX_ENTRY = np.dtype([('first', '<u8'), ('moves', '<u4'), ('direction', 'u1'), ('unused', 'u1', (3,))])
+GROW_BYTES = 1 << 20                    # Files are grown (and mapped) in 1MB chunks
+
+# Recording in progress
+moves_file = None   # Open files and their memory maps
+moves_map = None
+index_file = None
+index_map = None
+move_record = None  # NumPy dtype of a move record
+moves_used = 0      # Bytes of the moves file used
+passes = 0
+moves = 0
+previous = None     # Grain cells after the last pass
+header = None       # Moves file header values, apart from the counts
+
+
+def move_dtype(item_size):
+    # Move record for 16 or 32 bit items
+    item = '<u2' if item_size == 2 else '<u4'
+    return np.dtype([('grain', item), ('old', item), ('new', item)])
+
+
+def start(filename, cells, width, height):
+    global moves_file, moves_map, index_file, index_map, move_record, moves_used, passes, moves, previous, header
+    # Start a new recording (replacing any existing file), cells is the NumPy array of the grain start cells
+    item_size = 2 if max(len(cells), width * height) <= 0x10000 else 4
+    move_record = move_dtype(item_size)
+    header = (MAGIC, VERSION, item_size, len(cells), width, height)
+    passes = 0
+    moves = 0
+    previous = cells.copy()
+
+    moves_file = open(filename, 'w+b')
+    index_file = open(filename + '.index', 'w+b')
+    moves_map = grow(moves_file, None, GROW_BYTES)
+    index_map = grow(index_file, None, GROW_BYTES)
+
+    start_cells = cells.astype(move_record['grain']).tobytes()
+    moves_map[HEADER_SIZE:HEADER_SIZE + len(start_cells)] = start_cells
+    moves_used = HEADER_SIZE + len(start_cells)
+    write_headers()
+
+
+def grow(file, file_map, size):
+    # Extend the file to size bytes and map it, replacing the old map
+    if file_map is not None:
+        file_map.close()
+    file.truncate(size)
+    return mmap.mmap(file.fileno(), size)
+
+
+def write_headers():
+    HEADER.pack_into(moves_map, 0, *(header + (passes, moves)))
+    INDEX_HEADER.pack_into(index_map, 0, INDEX_MAGIC, VERSION, INDEX_ENTRY.itemsize, 0, passes)
+
+
+def record(cells, direction):
+    global moves_map, index_map, moves_used, passes, moves, previous
+    # Record the grains that moved in this pass, cells is the NumPy array of the grain cells after the pass
+    grain = np.flatnonzero(cells != previous)
+    pass_moves = np.empty(grain.size, dtype=move_record)
+    pass_moves['grain'] = grain
+    pass_moves['old'] = previous[grain]
+    pass_moves['new'] = cells[grain]
+    previous[grain] = cells[grain]
+
+    data = pass_moves.tobytes()
+    if moves_used + len(data) > len(moves_map):
+        moves_map = grow(moves_file, moves_map, len(moves_map) + max(GROW_BYTES, len(data)))
+    moves_map[moves_used:moves_used + len(data)] = data
+
+    entry = np.zeros(1, dtype=INDEX_ENTRY)
+    entry['first'] = moves
+    entry['moves'] = grain.size
+    entry['direction'] = direction
+    index_offset = HEADER_SIZE + passes * INDEX_ENTRY.itemsize
+    if index_offset + INDEX_ENTRY.itemsize > len(index_map):
+        index_map = grow(index_file, index_map, len(index_map) + GROW_BYTES)
+    index_map[index_offset:index_offset + INDEX_ENTRY.itemsize] = entry.tobytes()
+
+    moves_used = moves_used + len(data)
+    moves = moves + grain.size
+    passes = passes + 1
+    write_headers()
+
+
+def finish():
+    global moves_file, moves_map, index_file, index_map
+    # End the recording, the files are cut back to the size used
+    write_headers()
+    moves_map.close()
+    index_map.close()
+    moves_file.truncate(moves_used)
+    index_file.truncate(HEADER_SIZE + passes * INDEX_ENTRY.itemsize)
+    moves_file.close()
+    index_file.close()
+    moves_file = moves_map = index_file = index_map = None
+
+
+class PassReader(object):
+    """Reads a recording made by pass_recorder.  len() is the number of passes
+    recorded, and any pass can be read directly using the index.  The arrays
+    returned are views of the memory mapped files, so must be deleted (or
+    copied) before close().
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self._moves_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(filename + '.index', 'rb') as f:
+            self._index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, item_size, self.no_grains, self.width, self.height, passes, moves = \
+            HEADER.unpack_from(self._moves_map, 0)
+        index_magic, index_version, entry_size, _, index_passes = INDEX_HEADER.unpack_from(self._index_map, 0)
+        if magic != MAGIC or index_magic != INDEX_MAGIC:
+            raise ValueError("Not a pass recording: {}".format(filename))
+        if version != VERSION or index_version != VERSION or entry_size != INDEX_ENTRY.itemsize:
+            raise ValueError("Unsupported pass recording version: {}".format(version))
+
+        record = move_dtype(item_size)
+        start_bytes = self.no_grains * item_size
+        self.start_cells = np.frombuffer(self._moves_map, dtype=record['grain'], count=self.no_grains, offset=HEADER_SIZE)
+        self.moves = np.frombuffer(self._moves_map, dtype=record, count=moves, offset=HEADER_SIZE + start_bytes)
+        self.index = np.frombuffer(self._index_map, dtype=INDEX_ENTRY, count=min(passes, index_passes), offset=HEADER_SIZE)
+
+    def __len__(self):
+        return len(self.index)
+
+    def pass_moves(self, pass_no):
+        """Returns the (grain, old, new) move records of a pass, numbered from 0."""
+        entry = self.index[pass_no]
+        return self.moves[entry['first']:entry['first'] + entry['moves']]
+
+    def direction(self, pass_no):
+        """Returns the gravity direction used for a pass."""
+        return int(self.index[pass_no]['direction'])
+
+    def cells_before(self, pass_no):
+        """Returns the cell of each grain at the start of a pass (or after the
+        last pass if pass_no is len()), as a NumPy array.
+        """
+        cells = self.start_cells.astype(np.int64)
+        end = self.index[pass_no]['first'] if pass_no < len(self.index) else len(self.moves)
+        earlier = self.moves[:end][::-1] # Latest move of each grain first
+        grain, latest = np.unique(earlier['grain'], return_index=True)
+        cells[grain] = earlier['new'][latest]
+        return cells
+
+    def close(self):
+        self.start_cells = self.moves = self.index = None # Release the views so the maps can be closed
+        self._moves_map.close()
+        self._index_map.close()
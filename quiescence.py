@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : quiescence.py
+# Description :	Idle detection for continuous mode.  Once the grains have settled (a pass with no moves,
+#               or the grains going round a short cycle of the same positions) update_grains() stops
+#               moving grains and updating the display and just polls the orientation slowly, until the
+#               direction changes or a button is pressed.
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+from collections import deque
+
+# Import application modules
+import my_globals as g
+import dirty_tiles
+
+CYCLE_MOVES = 64    # Only passes moving this many grains or fewer are checked for a cycle
+
+history = deque()   # (framebuffer hash, direction) of the recent passes, for finding cycles
+
+
+def start():
+    global history
+    # Start watching a run, g.idle_cycle_passes is the longest cycle found
+    history = deque(maxlen=g.idle_cycle_passes)
+
+
+def settled(update_count, Direction):
+    # Returns True if the grains have settled after this pass - nothing moved, or the hourglass is back to how it was
+    # a few passes ago with the same direction, so it would go round the same cycle for ever
+    if update_count == 0:
+        return True
+    if update_count > CYCLE_MOVES or not history.maxlen:
+        history.clear() # Still running, a cycle only involves a few grains
+        return False
+
+    state = (hash(dirty_tiles.screen.tobytes()), Direction)
+    if state in history:
+        return True
+    history.append(state)
+    return False
+
+
+def wait():
+    # Wait for the next orientation poll, returns early if a button press changes the mode
+    with g.mode_changed:
+        g.mode_changed.wait_for(lambda: g.mode != g.CONTINUOUS, 1.0 / g.idle_poll_hz)
+    history.clear()
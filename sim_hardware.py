@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : sim_hardware.py
+# Description :	Stand-in display (spidev / RPi.GPIO), gyro (smbus) and button (gpiozero) backends
+#               so the hourglass modules can be run and measured on any Linux box.
+#               Call install() before importing any of the application modules.
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import sys
+import types
+
+# Import application modules
+import my_globals as g
+
+# SPI statistics, updated by the fake SpiDev
+spi_bytes = 0       # Total bytes sent over SPI (commands and data)
+spi_transfers = 0   # Number of SPI transactions
+spi_capture = None  # Set to a list to capture each transfer as (is_data, bytes), see capture_spi()
+DC_PIN = 9          # Display data/command pin, as used by hourglass.py
+
+# Raw accelerometer readings for each gravity direction, as (acc_x, acc_y, acc_z) register values.
+# Note the sensor x & y are swapped in the Pi Zero case, see read_gyro_xy()
+ONE_G = 16384
+ACCEL_FOR_DIRECTION = {
+    g.FLAT: (0, 0, ONE_G),
+    g.S: (-ONE_G, 0, 0),
+    g.N: (ONE_G, 0, 0),
+    g.W: (0, ONE_G, 0),
+    g.E: (0, -ONE_G, 0),
+    g.SW: (-11585, 11585, 0),  # 45 deg tilts
+    g.SE: (-11585, -11585, 0),
+    g.NE: (11585, -11585, 0),
+    g.NW: (11585, 11585, 0),
+}
+
+bus = None  # The fake SMBus created by the gyro module
+
+
+class SpiDev(object):
+    """Stand-in for spidev.SpiDev that counts the bytes sent."""
+
+    def __init__(self, port=None, cs=None):
+        self.mode = 0
+        self.lsbfirst = False
+        self.max_speed_hz = 0
+
+    def xfer(self, data):
+        global spi_bytes, spi_transfers
+        spi_bytes = spi_bytes + len(data)
+        spi_transfers = spi_transfers + 1
+        if spi_capture is not None:
+            spi_capture.append((bool(sys.modules['RPi.GPIO'].levels.get(DC_PIN)), bytes(bytearray(data))))
+        return [0] * len(data)
+
+    xfer2 = xfer
+    xfer3 = xfer
+
+    def writebytes(self, data):
+        self.xfer(data)
+
+    def writebytes2(self, data):
+        # Accepts any buffer object, as per spidev 3.4+
+        self.xfer(memoryview(data).cast('B'))
+
+    def close(self):
+        pass
+
+
+class SMBus(object):
+    """Stand-in for smbus.SMBus holding the MPU6050 registers in memory."""
+
+    def __init__(self, bus_no=1):
+        global bus
+        self.registers = bytearray(256)
+        self.reads = 0  # Number of register reads, ie I2C round trips
+        bus = self
+
+    def write_byte_data(self, addr, reg, value):
+        self.registers[reg] = value & 0xFF
+
+    def read_byte_data(self, addr, reg):
+        self.reads = self.reads + 1
+        return self.registers[reg]
+
+    def read_i2c_block_data(self, addr, reg, length=32):
+        # Block read of consecutive registers, a single I2C transfer
+        self.reads = self.reads + 1
+        return list(self.registers[reg:reg + length])
+
+    def set_word(self, reg, value):
+        # Store a signed 16 bit value as the high/low register pair starting at reg
+        value = value & 0xFFFF
+        self.registers[reg] = value >> 8
+        self.registers[reg + 1] = value & 0xFF
+
+
+class Button(object):
+    """Stand-in for gpiozero.Button, press() calls the when_pressed handler."""
+
+    def __init__(self, pin, *args, **kwargs):
+        self.pin = pin
+        self.when_pressed = None
+
+    def press(self):
+        if self.when_pressed is not None:
+            self.when_pressed()
+
+
+class _GPIO(types.ModuleType):
+    """Stand-in for RPi.GPIO, remembers the last level written to each pin."""
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self):
+        super().__init__('RPi.GPIO')
+        self.levels = {}
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, *args, **kwargs):
+        self.levels[pin] = 0
+
+    def output(self, pin, value):
+        self.levels[pin] = int(bool(value))
+
+    def cleanup(self, *args):
+        pass
+
+
+def install():
+    # Register the stand-in modules so 'import spidev' etc pick them up instead of the real hardware libraries
+    spidev = types.ModuleType('spidev')
+    spidev.SpiDev = SpiDev
+
+    smbus = types.ModuleType('smbus')
+    smbus.SMBus = SMBus
+
+    gpiozero = types.ModuleType('gpiozero')
+    gpiozero.Button = Button
+
+    rpi = types.ModuleType('RPi')
+    rpi.GPIO = _GPIO()
+
+    sys.modules['spidev'] = spidev
+    sys.modules['smbus'] = smbus
+    sys.modules['gpiozero'] = gpiozero
+    sys.modules['RPi'] = rpi
+    sys.modules['RPi.GPIO'] = rpi.GPIO
+
+
+def set_orientation(direction):
+    # Set the fake accelerometer so read_gyro_xy() returns the required gravity direction
+    from hourglassgyro import ACCEL_XOUT_H, ACCEL_YOUT_H, ACCEL_ZOUT_H
+    acc_x, acc_y, acc_z = ACCEL_FOR_DIRECTION[direction]
+    bus.set_word(ACCEL_XOUT_H, acc_x)
+    bus.set_word(ACCEL_YOUT_H, acc_y)
+    bus.set_word(ACCEL_ZOUT_H, acc_z)
+
+
+def capture_spi(enable=True):
+    global spi_capture
+    # Start (or stop) capturing the bytes sent over SPI, returns the capture list
+    spi_capture = [] if enable else None
+    return spi_capture
+
+
+def display_writes():
+    # Decode the captured SPI transfers into the display windows written, as a list of (x0, y0, x1, y1, pixel bytes)
+    commands = []
+    for is_data, data in spi_capture:
+        if not is_data:
+            commands.extend([data[i:i+1], bytearray()] for i in range(len(data)))
+        elif commands:
+            commands[-1][1] += data
+
+    writes = []
+    window = None
+    for command, data in commands:
+        if command == b'\x2a': # CASET
+            x0, x1 = (data[0] << 8) | data[1], (data[2] << 8) | data[3]
+        elif command == b'\x2b': # RASET
+            window = (x0, (data[0] << 8) | data[1], x1, (data[2] << 8) | data[3])
+        elif command == b'\x2c': # RAMWR
+            writes.append(window + (bytes(data),))
+    return writes
+
+
+def reset_counters():
+    global spi_bytes, spi_transfers
+    # Clear the SPI and I2C statistics, eg at the start of a benchmark run
+    spi_bytes = 0
+    spi_transfers = 0
+    if bus is not None:
+        bus.reads = 0
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+#############################################################################
+# Filename    : timer_replay.py
+# Description :	Replay of timer runs.  A timer run always starts from the same filled hourglass with the
+#               direction forced to S, so every run moves the grains exactly the same way.  The run is
+#               simulated once (without the display) and the pixels changed on each pass are saved, then
+#               timer runs just replay those changes.  Used as a grain engine, see grains.select_engine()
+# Author      : Trevor Fillary
+# modification: 17-10-2026
+########################################################################
+import os
+import zipfile
+from array import array
+
+import numpy as np
+from PIL import Image
+
+# Import application modules
+import my_globals as g
+import grains
+import grains_cache
+import dirty_tiles
+
+loaded_file = None  # Recording file currently loaded, None if there is no recording for the current fill
+
+# Recording - each pass's changes are a slice of the cleared/set cell arrays, from the previous pass's end
+cleared_y = None    # Cells (of the hourglass graphic) cleared on each pass
+cleared_x = None
+cleared_tile = None # Dirty display tile of each cleared cell
+cleared_ends = None # End of each pass's cleared cells
+set_y = None        # Cells set to a grain on each pass
+set_x = None
+set_tile = None
+set_colour = None   # Palette index of each set cell
+set_ends = None
+moves = None        # Grains moved on each pass, as returned by the engine
+final_grains = None # Sorted grains x/y at the end of the run
+final_image = None  # Hourglass graphic at the end of the run
+
+next_pass = 0       # Replay position
+dirty = None        # NumPy view of the dirty display tiles
+
+
+def replay_file(graphic_file):
+    # Recording file, per engine as the engines can move the grains slightly differently
+    return "{}-engine{}.replay.npz".format(os.path.splitext(grains_cache.cache_file(graphic_file))[0], g.engine)
+
+
+def load(graphic_file):
+    global loaded_file, cleared_y, cleared_x, cleared_tile, cleared_ends, set_y, set_x, set_tile, set_colour, set_ends, moves
+    global final_grains, final_image
+    # Load the recording for the current fill, returns False if there isn't one (see record())
+    filename = replay_file(graphic_file)
+    if filename == loaded_file:
+        return True
+    loaded_file = None
+    if not os.path.exists(filename):
+        return False
+
+    try:
+        with np.load(filename) as recording:
+            if int(recording['no_grains']) != g.no_grains:
+                return False
+            cleared = recording['cleared']
+            cleared_ends = recording['cleared_ends']
+            set_cells = recording['set']
+            set_colour = recording['set_colour']
+            set_ends = recording['set_ends']
+            moves = recording['moves']
+            final_grains = recording['grains']
+            final_image = recording['image']
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return False # Treat a damaged recording as missing, it will be recorded again
+
+    width = g.image.size[0]
+    tiles_across = (width + dirty_tiles.TILE_SIZE - 1) >> dirty_tiles.TILE_SHIFT
+    cleared_y, cleared_x = np.divmod(cleared.astype(np.int32), width)
+    cleared_tile = (cleared_y >> dirty_tiles.TILE_SHIFT) * tiles_across + (cleared_x >> dirty_tiles.TILE_SHIFT)
+    set_y, set_x = np.divmod(set_cells.astype(np.int32), width)
+    set_tile = (set_y >> dirty_tiles.TILE_SHIFT) * tiles_across + (set_x >> dirty_tiles.TILE_SHIFT)
+    g.timing_passes = len(moves)
+    loaded_file = filename
+    return True
+
+
+def record(graphic_file):
+    # Simulate a timer run with the selected engine, without the display, and save the pixels changed on each pass.
+    # The hourglass, grains and framebuffer are put back as they were afterwards
+    global loaded_file
+    loaded_file = None # So select_engine() returns the live engine
+
+    saved_image = g.image.copy()
+    saved_grains = [array('H', grains.sorted_grains_x), array('H', grains.sorted_grains_y)]
+    start_engine, move_engine, finish_engine = grains.select_engine()
+    # The engines write the grain moves into the framebuffer
+    dirty_tiles.reset(*g.image.size, grains.sorted_grains_x, grains.sorted_grains_y, g.no_grains)
+    screen = dirty_tiles.screen
+    saved_screen = screen.copy()
+
+    start_engine(grains.sorted_grains_x, grains.sorted_grains_y, g.no_grains)
+    cleared = []
+    set_cells = []
+    set_colours = []
+    pass_moves = []
+    previous = saved_screen
+    update_count = 1
+    while update_count != 0:
+        update_count = move_engine(g.S)
+        pass_moves.append(update_count)
+
+        current = screen.copy()
+        changed = np.flatnonzero(current != previous)
+        colour = current.ravel()[changed]
+        is_grain = colour != g.BACKGROUND_INDEX
+        cleared.append(changed[~is_grain])
+        set_cells.append(changed[is_grain])
+        set_colours.append(colour[is_grain])
+        previous = current
+    finish_engine(grains.sorted_grains_x, grains.sorted_grains_y)
+
+    # Cells are stored as 16 bit if the graphic is small enough, as pass_recorder.py does, otherwise 32 bit
+    cell_type = np.uint16 if screen.size <= 0x10000 else np.uint32
+    filename = replay_file(graphic_file)
+    os.makedirs(grains_cache.CACHE_DIR, exist_ok=True)
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, 'wb') as f:
+        np.savez_compressed(f,
+                            no_grains=g.no_grains,
+                            cleared=np.concatenate(cleared).astype(cell_type),
+                            cleared_ends=np.cumsum([cells.size for cells in cleared], dtype=np.int32),
+                            set=np.concatenate(set_cells).astype(cell_type),
+                            set_colour=np.concatenate(set_colours).astype(np.uint8),
+                            set_ends=np.cumsum([cells.size for cells in set_cells], dtype=np.int32),
+                            moves=np.array(pass_moves, dtype=np.int32),
+                            grains=np.array([np.frombuffer(grains_array, dtype=np.uint16)[:g.no_grains] for grains_array in
+                                             (grains.sorted_grains_x, grains.sorted_grains_y)]),
+                            image=np.array(g.image.convert('RGB')))
+    os.replace(temp_filename, filename)
+
+    # Back to the filled hourglass
+    g.image.paste(saved_image)
+    grains.sorted_grains_x[:] = saved_grains[0]
+    grains.sorted_grains_y[:] = saved_grains[1]
+    screen[:] = saved_screen
+
+    grains_cache.save_passes(graphic_file, len(pass_moves))
+    return load(graphic_file)
+
+
+def start(grains_x, grains_y, no_grains):
+    global next_pass, dirty
+    # Replay from the first pass, the grains must be in the filled position the recording was made from
+    next_pass = 0
+    dirty = np.frombuffer(dirty_tiles.dirty, dtype=np.uint8)
+
+
+def move_grains(Direction):
+    global next_pass
+    # Apply the next pass of the recording to the framebuffer, the direction is always S for a timer run.
+    # Returns the number of grains moved in this pass
+    if next_pass >= len(moves):
+        return 0
+    first_cleared = cleared_ends[next_pass - 1] if next_pass else 0
+    last_cleared = cleared_ends[next_pass]
+    first_set = set_ends[next_pass - 1] if next_pass else 0
+    last_set = set_ends[next_pass]
+    update_count = int(moves[next_pass])
+    next_pass = next_pass + 1
+
+    screen = dirty_tiles.screen
+    screen[cleared_y[first_cleared:last_cleared], cleared_x[first_cleared:last_cleared]] = g.BACKGROUND_INDEX
+    screen[set_y[first_set:last_set], set_x[first_set:last_set]] = set_colour[first_set:last_set]
+    dirty[cleared_tile[first_cleared:last_cleared]] = 1 # Flag the display tiles for the next update
+    dirty[set_tile[first_set:last_set]] = 1
+
+    return update_count
+
+
+def finish(grains_x, grains_y):
+    # Save the final grain positions and hourglass graphic as per the end of a live run
+    np.frombuffer(grains_x, dtype=np.uint16)[:g.no_grains] = final_grains[0]
+    np.frombuffer(grains_y, dtype=np.uint16)[:g.no_grains] = final_grains[1]
+    g.image.paste(Image.fromarray(final_image, 'RGB'))